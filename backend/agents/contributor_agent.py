@@ -3,6 +3,8 @@ import os
 import subprocess
 from collections import Counter
 
+from preprocessing.snapshot import RepoLike, repo_root
+
 class ContributorAgent:
     """
     Contributor analysis based on git commit history.
@@ -70,8 +72,8 @@ class ContributorAgent:
                 "error": str(e),
             }
 
-    def run(self, input_repo_path: str, cand_repo_path: str) -> Dict:
-        score, details = self.analyze(cand_repo_path)
+    def run(self, input_repo: RepoLike, cand_repo: RepoLike) -> Dict:
+        score, details = self.analyze(repo_root(cand_repo))
         return {
             "agent": "contributor",
             "score": round(float(score), 4),
@@ -20,7 +20,10 @@ SUPPORTED_EXT = (".py", ".java", ".js", ".ts", ".cpp", ".c")
 
 
 import os
-from typing import Dict, Any, Set
+import logging
+from typing import Dict, Any, List, Optional, Set
+
+import numpy as np
 
 from fingerprinting.simhash import (
     normalize_code,
@@ -32,13 +35,129 @@ from fingerprinting.simhash import (
 from fingerprinting.winnowing import (
     winnow,
     jaccard_similarity,
+    to_sorted_array,
+    pack_fingerprints,
+    FINGERPRINT_VERSIONS,
+    WINNOWING_MODE,
+)
+
+from fingerprinting.hamming_index import SimHashIndex, SIMHASH_MAX_DISTANCE, hamming_distances
+from fingerprinting.lsh import MinHasher, LSHIndex, band_keys
+from fingerprinting.manager import FP_BATCH_FILES, cache_namespace, fingerprint_files
+from preprocessing.snapshot import RepoLike, merkle_hash, stream_files
+from storage.db import (
+    save_repository,
+    get_repository_id,
+    load_file_fingerprints,
+    save_file_fingerprints,
+    save_fingerprint,
+    save_lsh_bands,
+    load_lsh_bands,
+    load_simhashes,
+    save_postings,
+    rank_by_overlap,
+    get_candidates_by_ids,
+    get_simhash_candidates,
 )
+from storage.fingerprint_cache import decode_value, encode_value, get_file_cache
+from storage.corpus_index import CorpusSnapshot, get_corpus_index, publish_ingested
 
-from storage.db import save_repository, save_fingerprint
 
+logger = logging.getLogger(__name__)
 
 SUPPORTED_EXT = (".py", ".java", ".js", ".ts", ".cpp", ".c")
 
+# per-file contributions are stored in Postgres by blob hash, so an
+# ingest on any worker only tokenizes and hashes new / changed blobs
+INCREMENTAL_INGEST = os.getenv("INCREMENTAL_INGEST", "1") == "1"
+
+_minhasher = MinHasher()
+
+# worker-side mirror of the lsh_bands table, refreshed before each
+# query with the rows written since the last refresh (by row txid, so
+# backfilled, re-banded and out-of-order commits are not missed)
+_lsh_mirror = LSHIndex()
+
+
+def _refresh_lsh_mirror():
+    rows, _lsh_mirror.loaded_txid = load_lsh_bands(after_txid=_lsh_mirror.loaded_txid)
+    _lsh_mirror.insert_rows(rows)
+
+
+# worker-side multi-index Hamming table over all stored SimHashes.
+# Local ingests are inserted directly, other workers' through refresh
+# (by row txid, as the LSH mirror; rewritten rows replace their entry).
+_simhash_index = SimHashIndex()
+_simhash_loaded_txid = 0
+
+
+def _refresh_simhash_index():
+    global _simhash_loaded_txid
+    rows, _simhash_loaded_txid = load_simhashes(after_txid=_simhash_loaded_txid)
+    for repo_id, simhash in rows:
+        _simhash_index.insert(repo_id, simhash)
+
+
+class _StoredContributions:
+    """
+    Per-file fingerprints of one ingest, as a fingerprint_files cache.
+
+    Contributions stored in Postgres (file_fingerprints) are fetched
+    FP_BATCH_FILES blobs at a time, in file order; the rest come from
+    the local file cache or are computed. save() then inserts only the
+    blobs Postgres did not have.
+    """
+
+    def __init__(self, namespace: str, blob_hashes: List[str], cache=None):
+        self.namespace = namespace
+        self.cache = cache
+        self._order = list(dict.fromkeys(blob_hashes))
+        self._position = {h: i for i, h in enumerate(self._order)}
+        self._fetched = 0
+        self._stored: Dict[str, bytes] = {}
+        self._known: Set[str] = set()
+        self._new: Dict[str, Any] = {}
+
+    def _fetch(self, blob_hash: str):
+        start = self._position[blob_hash]
+        batch = self._order[start : start + FP_BATCH_FILES]
+        self._stored = load_file_fingerprints(self.namespace, batch)
+        self._known.update(self._stored)
+        self._fetched = start + len(batch)
+
+    def get(self, namespace: str, blob_hash: str) -> Optional[Any]:
+        if namespace != self.namespace:
+            return self.cache.get(namespace, blob_hash) if self.cache is not None else None
+        if self._position.get(blob_hash, -1) >= self._fetched:
+            self._fetch(blob_hash)
+
+        data = self._stored.get(blob_hash)
+        if data is not None:
+            try:
+                return decode_value(data)
+            except Exception as e:
+                logger.warning(f"[FP] Corrupt stored contribution {blob_hash}: {e}")
+                self._known.discard(blob_hash)
+
+        value = self.cache.get(namespace, blob_hash) if self.cache is not None else None
+        if value is not None and blob_hash not in self._known:
+            self._new[blob_hash] = value
+        return value
+
+    def put(self, namespace: str, blob_hash: str, value: Any):
+        if self.cache is not None:
+            self.cache.put(namespace, blob_hash, value)
+        if namespace == self.namespace and blob_hash not in self._known:
+            self._new[blob_hash] = value
+
+    def save(self):
+        save_file_fingerprints(
+            self.namespace,
+            {blob_hash: encode_value(value) for blob_hash, value in self._new.items()},
+        )
+        self._known.update(self._new)
+        self._new.clear()
+
 
 class FingerprintAgent:
     """
@@ -50,43 +169,30 @@ class FingerprintAgent:
     3. Compare input fingerprint with DB fingerprints
     """
 
+    def __init__(self, winnowing_mode: str = WINNOWING_MODE):
+        self.winnowing_mode = winnowing_mode
+        self.fp_version = FINGERPRINT_VERSIONS[winnowing_mode]
+
     # --------------------------------------------------
     # STEP 1: Compute input fingerprint (filesystem)
     # --------------------------------------------------
-    def compute_input_fingerprint(self, repo_path: str) -> Dict[str, Any]:
-        tokens = []
-
-        for root, _, files in os.walk(repo_path):
-            for f in files:
-                if not f.lower().endswith(SUPPORTED_EXT):
-                    continue
-
-                file_path = os.path.join(root, f)
-                try:
-                    with open(file_path, "r", encoding="utf-8", errors="ignore") as fh:
-                        code = fh.read()
-                except Exception:
-                    continue
-
-                if not code.strip():
-                    continue
-
-                normalized = normalize_code(code)
-                toks = tokenize(normalized)
-                tokens.extend(toks)
-
-        if not tokens:
-            return {
-                "simhash": 0,
-                "winnowing": set(),
-                "token_count": 0,
-            }
+    def compute_input_fingerprint(self, repo: RepoLike) -> Dict[str, Any]:
+        return self._fingerprint(stream_files(repo, SUPPORTED_EXT))
+
+    def _fingerprint(self, files, cache=None) -> Dict[str, Any]:
+        # streamed file by file (memory bounded by the largest file);
+        # per-file results are cached by content hash,
+        # only new / changed blobs are tokenized and hashed
+        fp = fingerprint_files(
+            files,
+            mode=self.winnowing_mode,
+            cache=cache if cache is not None else get_file_cache(),
+        )
 
-        return {
-            "simhash": compute_simhash(tokens),
-            "winnowing": set(winnow(tokens)),
-            "token_count": len(tokens),
-        }
+        # sorted uint64 array: compact, and compared with searchsorted
+        fp["winnowing"] = to_sorted_array(fp["winnowing"])
+        fp["fp_version"] = self.fp_version
+        return fp
 
     # --------------------------------------------------
     # STEP 2: INGEST input repo into DB (CRITICAL)
@@ -94,21 +200,46 @@ class FingerprintAgent:
     def ingest_repo(
         self,
         repo_url: str,
-        repo_path: str,
+        repo: RepoLike,
+        incremental: bool = INCREMENTAL_INGEST,
     ) -> Dict[str, Any]:
         """
         Compute fingerprint and persist it to DB.
         This is what makes the system LEARN.
-        """
-
-        fp = self.compute_input_fingerprint(repo_path)
 
+        An unchanged repo (same url and content identity, same
+        fingerprint version) is not fingerprinted again: the stored
+        fingerprint is returned. Per-file contributions are stored in
+        Postgres by blob hash: files seen before, by any worker, are not
+        tokenized again, and only new blobs' rows are written.
+        """
+        # hashed while streamed, so each file is closed right after
+        files, entries = [], []
+        for f in stream_files(repo, SUPPORTED_EXT):
+            entries.append((f.posix_path, f.content_hash))
+            files.append(f)
+
+        # Merkle hash of the supported files, checked before tokenisation
+        content_hash = merkle_hash(entries)
+
+        stored = self.load_stored_fingerprint(repo_url, content_hash)
+        if stored is not None:
+            return stored
+
+        contributions = None
+        if incremental:
+            contributions = _StoredContributions(
+                cache_namespace(mode=self.winnowing_mode),
+                [blob_hash for _, blob_hash in entries],
+                get_file_cache(),
+            )
+
+        fp = self._fingerprint(files, contributions)
+        if contributions is not None:
+            contributions.save()
         if fp["token_count"] == 0:
             return fp
 
-        # Using simhash as content identity (good enough here)
-        content_hash = str(fp["simhash"])
-
         repo_id = save_repository(repo_url, content_hash)
 
         # ---- save simhash fingerprint ----
@@ -123,18 +254,206 @@ class FingerprintAgent:
         )
 
         # ---- save winnowing fingerprint ----
+        # hashes go to the bytea column as packed little-endian uint64,
+        # extra_data only keeps the metadata
         save_fingerprint(
             repo_id=repo_id,
             agent="winnowing",
             score=1.0,
-            extra_data={   # ✅ FIXED
-                "winnowing": list(fp["winnowing"]),
+            extra_data={
+                "format": "u64",
+                "count": len(fp["winnowing"]),
                 "token_count": fp["token_count"],
+                "fp_version": fp["fp_version"],
             },
+            data=pack_fingerprints(fp["winnowing"]),
         )
 
+        # ---- index for postings / LSH / Hamming candidate retrieval ----
+        if len(fp["winnowing"]):
+            save_postings(repo_id, fp["winnowing"])
+            save_lsh_bands(repo_id, self.lsh_keys(fp))
+
+        _simhash_index.insert(repo_id, fp["simhash"])
+
+        fp["repo_id"] = repo_id
+
+        # other workers append it to their corpus index
+        publish_ingested(repo_id)
+
         return fp
 
+    def load_stored_fingerprint(
+        self,
+        repo_url: str,
+        content_hash: str,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fingerprint of an already ingested snapshot, in the shape of
+        compute_input_fingerprint, or None when it must be (re)computed.
+        """
+        repo_id = get_repository_id(repo_url, content_hash)
+        if repo_id is None:
+            return None
+
+        rows = get_candidates_by_ids([repo_id])
+        if not rows:
+            return None
+
+        row = rows[0]
+        # incomplete ingest or other fingerprint version: recompute
+        if row["fp_version"] != self.fp_version or not row["token_count"]:
+            return None
+
+        return {
+            "repo_id": repo_id,
+            "simhash": row["simhash"],
+            "winnowing": row["winnowing"],
+            "token_count": row["token_count"],
+            "fp_version": row["fp_version"],
+        }
+
+    # --------------------------------------------------
+    # Candidate retrieval (MinHash LSH)
+    # --------------------------------------------------
+    def lsh_keys(self, fp: Dict[str, Any]) -> List[int]:
+        signature = _minhasher.signature(fp["winnowing"])
+        return band_keys(signature, fp_version=fp.get("fp_version", 1))
+
+    def find_candidates(
+        self,
+        input_fp: Dict[str, Any],
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Most likely near neighbours of input_fp, in the same shape as
+        storage.db.get_simhash_candidates.
+
+        Ranked by exact winnowing overlap: from the worker's warm corpus
+        index when loaded (no DB round-trip), otherwise from the postings
+        index, where hash arrays are not fetched and each candidate
+        carries its "overlap" instead. Falls back to LSH for corpora not
+        indexed yet. The input repo itself (input_fp["repo_id"] once
+        ingested) is never a candidate.
+        """
+        if not len(input_fp["winnowing"]):
+            return []
+
+        corpus = get_corpus_index()
+        if corpus is not None:
+            return self.find_corpus_candidates(corpus.current, input_fp, limit=limit)
+
+        candidates = self.find_overlap_candidates(input_fp, limit=limit)
+        if candidates:
+            return candidates
+
+        _refresh_lsh_mirror()
+
+        # the input repo's own bands were just stored, they do not count
+        own = input_fp.get("repo_id")
+        if len(_lsh_mirror) - (own in _lsh_mirror) == 0:
+            # bands not built yet, see storage/migrations.py
+            return get_simhash_candidates(limit=limit)
+
+        hits = _lsh_mirror.query(self.lsh_keys(input_fp), limit=limit + 1)
+        repo_ids = [repo_id for repo_id, _ in hits if repo_id != own][:limit]
+
+        # SimHash near-duplicates are always candidates, even when
+        # their winnowing sets did not collide in any band
+        for near in self.find_near_duplicates(input_fp["simhash"], exclude_repo_id=own):
+            if near["repo_id"] not in repo_ids:
+                repo_ids.append(near["repo_id"])
+
+        return get_candidates_by_ids(repo_ids)
+
+    def find_corpus_candidates(
+        self,
+        snapshot: CorpusSnapshot,
+        input_fp: Dict[str, Any],
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        own = input_fp.get("repo_id")
+        overlaps = {
+            o["repo_id"]: o
+            for o in snapshot.rank_by_overlap(
+                input_fp["winnowing"],
+                input_fp.get("fp_version", 1),
+                limit=limit,
+                exclude_repo_id=own,
+            )
+        }
+        near = [
+            n["repo_id"]
+            for n in snapshot.near_duplicates(
+                input_fp["simhash"], SIMHASH_MAX_DISTANCE, exclude_repo_id=own
+            )
+            if n["repo_id"] not in overlaps
+        ]
+
+        # candidates carry their (zero-copy) winnowing arrays,
+        # ranked ones also their overlap
+        candidates = snapshot.candidates(list(overlaps) + near)
+        for cand in candidates:
+            if cand["repo_id"] in overlaps:
+                cand["overlap"] = overlaps[cand["repo_id"]]
+        return candidates
+
+    def find_overlap_candidates(
+        self,
+        input_fp: Dict[str, Any],
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        fp_version = input_fp.get("fp_version", 1)
+        own = input_fp.get("repo_id")
+        overlaps = {
+            o["repo_id"]: o
+            for o in rank_by_overlap(
+                input_fp["winnowing"], fp_version, limit=limit, exclude_repo_id=own
+            )
+        }
+        if not overlaps:
+            return []
+
+        # SimHash near-duplicates outside the top-N still get scored
+        near = [
+            n["repo_id"]
+            for n in self.find_near_duplicates(input_fp["simhash"], exclude_repo_id=own)
+            if n["repo_id"] not in overlaps
+        ]
+        if near:
+            for o in rank_by_overlap(input_fp["winnowing"], fp_version, repo_ids=near):
+                overlaps[o["repo_id"]] = o
+
+        candidates = get_candidates_by_ids(list(overlaps) + near, with_winnowing=False)
+        for cand in candidates:
+            cand["overlap"] = overlaps.get(
+                cand["repo_id"], {"shared": 0, "n_hashes": 0}
+            )
+        return candidates
+
+    def find_near_duplicates(
+        self,
+        simhash: int,
+        max_distance: int = SIMHASH_MAX_DISTANCE,
+        exclude_repo_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        All stored repos whose SimHash is within max_distance bits,
+        closest first (multi-index Hamming search, no corpus scan),
+        except exclude_repo_id.
+        """
+        _refresh_simhash_index()
+
+        return [
+            {
+                "repo_id": repo_id,
+                "distance": distance,
+                "simhash_score": round(1 - distance / 64, 4),
+            }
+            for repo_id, distance in _simhash_index.query(simhash, max_distance)
+            if repo_id != exclude_repo_id
+        ]
+
     # --------------------------------------------------
     # STEP 3: Compare with DB fingerprints (NO FS)
     # --------------------------------------------------
@@ -148,9 +467,12 @@ class FingerprintAgent:
         {
             "repo_url": str,
             "simhash": int,
-            "winnowing": Set[int],
-            "token_count": int
+            "winnowing": np.ndarray (sorted uint64),
+            "token_count": int,
+            "fp_version": int
         }
+        or, instead of "winnowing", "overlap": {"shared", "n_hashes"}
+        from the postings index.
         """
 
         simhash_score = simhash_similarity(
@@ -158,11 +480,138 @@ class FingerprintAgent:
             db_fp["simhash"],
         )
 
-        winnowing_score = jaccard_similarity(
-            input_fp["winnowing"],
-            set(db_fp["winnowing"]),
+        # winnowing hashes of different versions live in different spaces
+        versions_match = (
+            input_fp.get("fp_version", 1) == db_fp.get("fp_version", 1)
         )
 
+        overlap = db_fp.get("overlap")
+
+        if versions_match and overlap is not None:
+            union = len(input_fp["winnowing"]) + overlap["n_hashes"] - overlap["shared"]
+            winnowing_score = overlap["shared"] / union if union > 0 else 0.0
+        elif versions_match:
+            winnowing_score = jaccard_similarity(
+                input_fp["winnowing"],
+                db_fp["winnowing"],
+            )
+        else:
+            winnowing_score = 0.0
+
+        return self._result(input_fp, db_fp, simhash_score, winnowing_score, versions_match)
+
+    def compare_many(
+        self,
+        input_fp: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        top_k: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        compare_with_db for many candidates in one vectorized pass,
+        best combined score first, only the top_k results built.
+
+        - SimHash: XOR + popcount over a uint64 array
+        - Winnowing: candidate hashes concatenated with owner labels
+          (sparse hash -> repo incidence), matched against the sorted
+          input with searchsorted, shared counts via bincount
+        """
+        input_version = input_fp.get("fp_version", 1)
+        input_hashes = input_fp["winnowing"]
+        if not isinstance(input_hashes, np.ndarray):
+            input_hashes = to_sorted_array(input_hashes)
+        n_input = len(input_hashes)
+
+        # malformed rows are logged and skipped, not fatal to the batch
+        valid, simhashes, versions = [], [], []
+        shared_list, sizes_list, arrays, owners = [], [], [], []
+        for cand in candidates:
+            try:
+                simhash = int(cand["simhash"])
+                if not 0 <= simhash < 1 << 64:
+                    raise ValueError(f"simhash out of range: {simhash}")
+                version_ok = cand.get("fp_version", 1) == input_version
+                overlap = cand.get("overlap")
+                array = None
+                if not version_ok:
+                    counts = (0, 0)
+                elif overlap is not None:
+                    counts = (int(overlap["shared"]), int(overlap["n_hashes"]))
+                else:
+                    array = np.asarray(cand["winnowing"], dtype=np.uint64).ravel()
+                    counts = (0, len(array))
+                missing = {"repo_url", "token_count"} - cand.keys()
+                if missing:
+                    raise KeyError(f"missing {sorted(missing)}")
+            except Exception:
+                logger.exception(f"[FP COMPARE FAILED] {cand.get('repo_url')}")
+                continue
+
+            if array is not None:
+                arrays.append(array)
+                owners.append(len(valid))
+            valid.append(cand)
+            simhashes.append(simhash)
+            versions.append(version_ok)
+            shared_list.append(counts[0])
+            sizes_list.append(counts[1])
+
+        candidates = valid
+        n = len(candidates)
+        if not n:
+            return []
+
+        simhashes = np.array(simhashes, dtype=np.uint64)
+        simhash_scores = 1 - hamming_distances(input_fp["simhash"], simhashes) / 64
+
+        versions_match = np.array(versions, dtype=bool)
+
+        # shared hash counts; postings / corpus overlaps are reused
+        shared = np.array(shared_list, dtype=np.int64)
+        sizes = np.array(sizes_list, dtype=np.int64)
+
+        if arrays and n_input:
+            hashes = np.concatenate(arrays)
+            labels = np.repeat(owners, [len(a) for a in arrays])
+            pos = np.searchsorted(input_hashes, hashes)
+            pos[pos == n_input] = 0
+            hit = input_hashes[pos] == hashes
+            shared += np.bincount(labels[hit], minlength=n)
+
+        union = n_input + sizes - shared
+        winnowing_scores = np.where(
+            versions_match & (n_input > 0) & (union > 0),
+            shared / np.maximum(union, 1),
+            0.0,
+        )
+
+        combined = (simhash_scores + winnowing_scores) / 2.0
+
+        # partial sort: only the top_k are ordered
+        if top_k is not None and top_k < n:
+            selected = np.argpartition(-combined, top_k - 1)[:top_k]
+        else:
+            selected = np.arange(n)
+        selected = selected[np.lexsort((selected, -combined[selected]))]
+
+        return [
+            self._result(
+                input_fp,
+                candidates[i],
+                float(simhash_scores[i]),
+                float(winnowing_scores[i]),
+                bool(versions_match[i]),
+            )
+            for i in selected
+        ]
+
+    def _result(
+        self,
+        input_fp: Dict[str, Any],
+        db_fp: Dict[str, Any],
+        simhash_score: float,
+        winnowing_score: float,
+        versions_match: bool,
+    ) -> Dict[str, Any]:
         combined = (simhash_score + winnowing_score) / 2.0
 
         return {
@@ -174,5 +623,6 @@ class FingerprintAgent:
                 "candidate_repo": db_fp["repo_url"],
                 "input_tokens": input_fp["token_count"],
                 "candidate_tokens": db_fp["token_count"],
+                "fp_version_mismatch": not versions_match,
             },
         }
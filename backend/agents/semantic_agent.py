@@ -1,8 +1,11 @@
 from typing import Dict, List
-import os
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from preprocessing.snapshot import RepoLike, snapshot_of
+
+TEXT_EXTENSIONS = (".py", ".java", ".js", ".md")
+
 _model = None
 
 def _get_model(name="sentence-transformers/all-MiniLM-L6-v2"):
@@ -17,23 +20,13 @@ class SemanticAgent:
         self.model_name = model_name or "sentence-transformers/all-MiniLM-L6-v2"
         self.model = _get_model(self.model_name)
 
-    def _collect_texts(self, repo_path: str) -> List[str]:
+    def _collect_texts(self, repo: RepoLike) -> List[str]:
         texts = []
-        for root, _, files in os.walk(repo_path):
-            for f in files:
-                if f.endswith((".py", ".java", ".js", ".md")):
-                    try:
-                        with open(
-                            os.path.join(root, f),
-                            "r",
-                            encoding="utf-8",
-                            errors="ignore",
-                        ) as fh:
-                            content = fh.read().strip()
-                            if content:
-                                texts.append(content[:2000])
-                    except Exception:
-                        continue
+        with snapshot_of(repo) as snapshot:
+            for f in snapshot.select(TEXT_EXTENSIONS):
+                content = f.text.strip()
+                if content:
+                    texts.append(content[:2000])
         return texts
 
     def _embed(self, texts: List[str]) -> np.ndarray:
@@ -42,9 +35,9 @@ class SemanticAgent:
         norms[norms == 0] = 1
         return vecs / norms
 
-    def run(self, input_repo_path: str, cand_repo_path: str) -> Dict:
-        input_texts = self._collect_texts(input_repo_path)
-        cand_texts = self._collect_texts(cand_repo_path)
+    def run(self, input_repo: RepoLike, cand_repo: RepoLike) -> Dict:
+        input_texts = self._collect_texts(input_repo)
+        cand_texts = self._collect_texts(cand_repo)
 
         if not input_texts or not cand_texts:
             return {
@@ -1,11 +1,34 @@
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 import os
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-# Importing the logic we fixed earlier
-from fingerprinting.parsing.language_detector import detect_language
+import numpy as np
+
+from fingerprinting.manager import get_process_pool
 from fingerprinting.parsing.treesitter_parser import TreeSitterParser
+from fingerprinting.clones import (
+    CLONE_DIMS,
+    CLONE_MIN_NODES,
+    UNIT_TYPES,
+    best_matches,
+    clone_coverage,
+    unit_vectors,
+)
+from fingerprinting.structure import (
+    Signature,
+    best_match,
+    named_node_spans,
+    node_type_hashes,
+    signature_jaccard,
+    tree_signature,
+    type_signature,
+)
+from fingerprinting.uast.uast_builder import UASTBuilder
+from fingerprinting.uast.uast_index import UAST_MIN_HEIGHT, SubtreeIndex, UASTEntry, uast_entry
+from preprocessing.snapshot import RepoLike, SnapshotFile, snapshot_of
+from storage.fingerprint_cache import get_file_cache
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +37,134 @@ ALLOWED_EXTENSIONS = {
     ".py", ".java", ".cpp", ".c", ".h",
 }
 
-EXCLUDED_FOLDERS = {
-    "node_modules", "__pycache__", ".git",
-    "dist", "build", ".next", "coverage"
-}
+# per-file signatures are cached by blob hash under this namespace
+STRUCT_CACHE_NAMESPACE = "struct-v2"
+
+# ------------------------------------------------------
+# Function-level clones (STRUCT_CLONES=1)
+# Function / class units of every file are reduced to node-type bigram
+# count vectors (fingerprinting.clones, cached by blob hash), so a function
+# copied into a large file is not diluted by the rest of the file.
+# The clone coverage of either repo (share of its units matched
+# >= CLONE_MIN_SIMILARITY, weighted by size) can raise the score.
+# ------------------------------------------------------
+STRUCT_CLONES = os.getenv("STRUCT_CLONES", "0") == "1"
+CLONE_CACHE_NAMESPACE = f"clone-v1-b{CLONE_DIMS}-n{CLONE_MIN_NODES}"
+
+# ------------------------------------------------------
+# Cross-language UAST mode (STRUCT_UAST=1)
+# Files are also reduced to language-agnostic UAST subtree-hash
+# sets weighted by subtree size (cached by blob hash), and every
+# input file is matched against candidate files of other languages
+# through a per-repo inverted index of subtree hashes. The repo
+# score averages the input files' best matches, weighted by size,
+# so one lucky pair among many does not decide it.
+# ------------------------------------------------------
+STRUCT_UAST = os.getenv("STRUCT_UAST", "0") == "1"
+UAST_CACHE_NAMESPACE = f"uast-v2-d{UASTBuilder.MAX_DEPTH}-h{UAST_MIN_HEIGHT}"
+
+# ------------------------------------------------------
+# Parallel parsing of uncached files
+#   STRUCT_PARSE_WORKERS   workers (0 = cpu count, 1 = serial)
+#   STRUCT_PARSE_MODE      "thread": tree-sitter parses with the GIL
+#                          released, one parser per thread;
+#                          "process": workers return signatures only
+#                          (falls back to threads in daemon processes)
+# ------------------------------------------------------
+STRUCT_PARSE_WORKERS = int(os.getenv("STRUCT_PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
+STRUCT_PARSE_MODE = os.getenv("STRUCT_PARSE_MODE", "thread")
+
+# files below this many non-blank characters are not compared
+_MIN_CODE_CHARS = 20
+
+
+# (signature, unit vectors or None, UAST entry or None) of one file
+FileStructure = Tuple[Signature, Optional[np.ndarray], Optional[UASTEntry]]
+
+
+def _text_structure(text: str, language: str, uast: bool = False, clones: bool = False) -> Optional[FileStructure]:
+    """
+    Signature (with clone units / UAST entry if asked) of one source
+    text from a single parse and traversal; signature () if too small,
+    None if unparseable.
+    """
+    if len(text.strip()) < _MIN_CODE_CHARS:
+        return (), None, None   # cacheable "too small" marker
+    tree = TreeSitterParser.parse_code(text, language)
+    if not tree or not tree.root_node:
+        return None
+
+    types, spans = named_node_spans(tree.root_node, UNIT_TYPES if clones else ())
+    hashes = node_type_hashes(types)
+    return (
+        type_signature(hashes),
+        unit_vectors(hashes, spans) if clones else None,
+        uast_entry(tree) if uast else None,
+    )
+
+
+def _path_structure(path: str, language: str, uast: bool = False, clones: bool = False) -> Optional[FileStructure]:
+    """Process pool task: read and parse one file (same text as SnapshotFile)."""
+    try:
+        with open(path, "rb") as fh:
+            text = str(fh.read(), "utf-8", "ignore")
+        return _text_structure(text, language, uast, clones)
+    except Exception as e:
+        logger.debug(f"[STRUCT] Skip {path}: {e}")
+        return None
+
+
+def _file_structure(f: SnapshotFile, uast: bool = False, clones: bool = False) -> Optional[FileStructure]:
+    try:
+        return _text_structure(f.text, f.language, uast, clones)
+    except Exception as e:
+        logger.debug(f"[STRUCT] Skip {f.path}: {e}")
+        return None
+
+
+_threads: Optional[ThreadPoolExecutor] = None
+_threads_workers = 0
+
+
+def _get_threads(workers: int) -> ThreadPoolExecutor:
+    """Shared parse threads (their parsers are reused across tasks)."""
+    global _threads, _threads_workers
+    if _threads is None or _threads_workers != workers:
+        if _threads is not None:
+            _threads.shutdown(wait=False)
+        _threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="struct-parse")
+        _threads_workers = workers
+    return _threads
+
+
+def parse_structures(
+    files: List[SnapshotFile],
+    uast: bool = False,
+    clones: bool = False,
+    workers: int = STRUCT_PARSE_WORKERS,
+    mode: str = STRUCT_PARSE_MODE,
+) -> List[Optional[FileStructure]]:
+    """(signature, units, UAST entry) of files (None where unparseable), in file order."""
+    workers = min(workers, len(files))
+    if workers <= 1:
+        return [_file_structure(f, uast, clones) for f in files]
+
+    if mode == "process":
+        pool = get_process_pool(workers)
+        if pool is not None:
+            return list(
+                pool.map(
+                    _path_structure,
+                    [f.path for f in files],
+                    [f.language for f in files],
+                    [uast] * len(files),
+                    [clones] * len(files),
+                    chunksize=max(1, len(files) // (4 * workers)),
+                )
+            )
+
+    return list(_get_threads(workers).map(_file_structure, files, [uast] * len(files), [clones] * len(files)))
+
 
 class StructuralAgent:
     """
@@ -25,95 +172,196 @@ class StructuralAgent:
     - Parses code into Tree-sitter Trees.
     - Groups trees by language.
     - Compares structural similarity using Tree-sitter node properties.
+    - Each file is traversed once into a cached signature.
+    - All pairs of a language are scored in one blocked sparse product,
+      or, for many files, only the pairs proposed by MinHash LSH.
+    - Function / class units are compared too (Euclidean LSH when many).
+    - Optional UAST mode also compares files across languages.
     """
 
-    def _build_repo_trees(self, repo_path: str) -> Dict[str, List]:
-        """Traverses repo and builds a map of {lang: [root_nodes]}"""
+    def __init__(self, uast_mode: bool = STRUCT_UAST, clone_mode: bool = STRUCT_CLONES):
+        self.uast_mode = uast_mode
+        self.clone_mode = clone_mode
+
+    def _build_repo_trees(self, repo: RepoLike) -> Dict[str, List]:
+        """Builds a map of {lang: [signatures]} from the repo snapshot"""
+        return self._build_repo(repo)[0]
+
+    def _build_repo(self, repo: RepoLike, uast: bool = False, clones: bool = False):
+        """
+        ({lang: [signatures]}, {lang: unit vectors}, [(lang, UAST entry)])
+        from the repo snapshot; units / UAST entries only if asked.
+        """
+        cache = get_file_cache()
         tree_map = defaultdict(list)
-        for root, dirs, files in os.walk(repo_path):
-            dirs[:] = [d for d in dirs if d not in EXCLUDED_FOLDERS]
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext not in ALLOWED_EXTENSIONS:
-                    continue
-                
-                file_path = os.path.join(root, file)
-                lang = detect_language(file_path)
-                if not lang:
-                    continue
+        unit_map = defaultdict(list)
+        uast_files = []
+        # (cache namespace, wanted) of the parts after the signature
+        extras = [(CLONE_CACHE_NAMESPACE, clones), (UAST_CACHE_NAMESPACE, uast)]
 
+        with snapshot_of(repo) as snapshot:
+            # files without an installed grammar are skipped unread
+            parseable = TreeSitterParser.available_languages()
+            files = [f for f in snapshot.select(ALLOWED_EXTENSIONS) if f.language in parseable]
+
+            structures = []
+            for f in files:
+                parts = [None, None, None]
                 try:
-                    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-                        code = f.read()
-                    
-                    if len(code.strip()) < 20:
-                        continue
-
-                    tree = TreeSitterParser.parse_code(code, lang)
-                    if tree and tree.root_node:
-                        tree_map[lang].append(tree.root_node)
+                    if cache:
+                        parts[0] = cache.get(STRUCT_CACHE_NAMESPACE, f.content_hash)
+                        for k, (namespace, wanted) in enumerate(extras, 1):
+                            if wanted and parts[0]:
+                                parts[k] = cache.get(namespace, f.content_hash)
                 except Exception as e:
-                    logger.debug(f"[STRUCT] Skip {file_path}: {e}")
-        return tree_map
-
-    def _compare_trees(self, node1, node2) -> float:
-        """Robust structural comparison using Iterative Traversal."""
-        def get_safe_structural_list(root_node):
-            nodes = []
-            stack = [root_node]
-            while stack:
-                curr = stack.pop()
-                if curr.is_named:
-                    nodes.append(curr.type)
-                for i in range(curr.child_count - 1, -1, -1):
-                    stack.append(curr.child(i))
-            return nodes
+                    logger.debug(f"[STRUCT] Cache read failed for {f.path}: {e}")
+                structures.append(parts)
 
-        try:
-            list1 = get_safe_structural_list(node1)
-            list2 = get_safe_structural_list(node2)
+            # only uncached files are parsed (once for all parts), concurrently
+            misses = [
+                i for i, parts in enumerate(structures)
+                if parts[0] is None
+                or (parts[0] and any(wanted and parts[k] is None for k, (_, wanted) in enumerate(extras, 1)))
+            ]
+            parsed = parse_structures([files[i] for i in misses], uast=uast, clones=clones)
+
+            for i, structure in zip(misses, parsed):
+                if structure is None:
+                    continue
+                parts = structures[i] = list(structure)
+                if cache:
+                    cache.put(STRUCT_CACHE_NAMESPACE, files[i].content_hash, parts[0])
+                if not parts[0]:
+                    continue
+                if uast and parts[2] is None:
+                    parts[2] = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), 0)   # no mapped node
+                for k, (namespace, wanted) in enumerate(extras, 1):
+                    if wanted and cache:
+                        cache.put(namespace, files[i].content_hash, parts[k])
 
-            if not list1 or not list2:
-                return 0.0
+            # file order is kept, so results do not depend on workers
+            for f, (sig, units, entry) in zip(files, structures):
+                if not sig:
+                    continue
+                tree_map[f.language].append(sig)
+                if clones and units is not None and len(units):
+                    unit_map[f.language].append(units)
+                if uast and entry is not None and entry[2]:
+                    uast_files.append((f.language, entry))
 
-            set1 = set(f"{list1[i]}->{list1[i+1]}" for i in range(len(list1)-1))
-            set2 = set(f"{list2[i]}->{list2[i+1]}" for i in range(len(list2)-1))
+        unit_map = {lang: np.concatenate(units) for lang, units in unit_map.items()}
+        return tree_map, unit_map, uast_files
 
-            if not set1 or not set2:
-                set1, set2 = set(list1), set(list2)
+    @staticmethod
+    def _signature(root_node) -> Signature:
+        """(node-type bigram hashes, node-type hashes) of one tree, one traversal."""
+        return tree_signature(root_node)
 
-            intersection = len(set1.intersection(set2))
-            union = len(set1.union(set2))
-            return float(intersection) / union if union > 0 else 0.0
+    def _compare_trees(self, sig1, sig2) -> float:
+        """Structural Jaccard of two precomputed signatures."""
+        try:
+            return signature_jaccard(sig1, sig2)
         except Exception as e:
             logger.error(f"Structural comparison failed: {e}")
             return 0.0
 
-    def run(self, input_repo_path: str, cand_repo_path: str, simhash_score: Optional[float] = None) -> Dict:
+    def run(self, input_repo: RepoLike, cand_repo: RepoLike, simhash_score: Optional[float] = None) -> Dict:
         """Orchestrator Entry Point"""
         # 1. Fast Path for nearly identical files
         if simhash_score is not None and simhash_score >= 0.98:
             return {"agent": "structural", "score": 1.0, "details": {"status": "skipped_high_sim"}}
 
         # 2. Build Tree Maps
-        input_map = self._build_repo_trees(input_repo_path)
-        cand_map = self._build_repo_trees(cand_repo_path)
+        input_map, input_units, input_uast = self._build_repo(input_repo, self.uast_mode, self.clone_mode)
+        cand_map, cand_units, cand_uast = self._build_repo(cand_repo, self.uast_mode, self.clone_mode)
 
-        # 3. Compare within same languages
-        scores = [0.0]
+        # 3. Compare within same languages (vectorized, LSH-pruned when large)
+        final_score = 0.0
+        comparisons = 0
+        pairs = 0
         for lang, in_trees in input_map.items():
             if lang in cand_map:
-                for t1 in in_trees:
-                    for t2 in cand_map[lang]:
-                        scores.append(self._compare_trees(t1, t2))
+                score, scored = best_match(in_trees, cand_map[lang])
+                final_score = max(final_score, score)
+                comparisons += scored
+                pairs += len(in_trees) * len(cand_map[lang])
+
+        details = {
+            "input_files": sum(len(v) for v in input_map.values()),
+            "cand_files": sum(len(v) for v in cand_map.values()),
+            "comparisons": comparisons,
+            "pairs_pruned": pairs - comparisons,
+        }
+
+        # 4. Compare function / class units (copied functions in large files)
+        if self.clone_mode:
+            clone_score, clone_pairs = self._compare_clones(input_units, cand_units)
+            final_score = max(final_score, clone_score)
+            details["clones"] = {
+                "score": round(clone_score, 4),
+                "input_units": sum(len(v) for v in input_units.values()),
+                "cand_units": sum(len(v) for v in cand_units.values()),
+                "comparisons": clone_pairs,
+            }
+
+        # 5. Compare across languages (UAST mode)
+        if self.uast_mode:
+            uast_score, uast_pairs = self._compare_uast(input_uast, cand_uast)
+            final_score = max(final_score, uast_score)
+            details["uast"] = {"score": round(uast_score, 4), "cross_language_pairs": uast_pairs}
 
-        final_score = max(scores)
         return {
             "agent": "structural",
             "score": round(float(final_score), 4),
-            "details": {
-                "input_files": sum(len(v) for v in input_map.values()),
-                "cand_files": sum(len(v) for v in cand_map.values()),
-                "comparisons": len(scores) - 1
-            }
-        }
\ No newline at end of file
+            "details": details,
+        }
+
+    @staticmethod
+    def _compare_clones(input_units, cand_units) -> Tuple[float, int]:
+        """
+        Clone coverage of two repos (the larger of the input's and the
+        candidate's), units matched within the same language; and the
+        number of unit pairs scored.
+        """
+        sides = {"input": input_units, "cand": cand_units}
+        best = {side: {lang: np.zeros(len(v)) for lang, v in units.items()} for side, units in sides.items()}
+        pairs = 0
+        for lang, units in input_units.items():
+            if lang in cand_units:
+                best["input"][lang], best["cand"][lang], scored = best_matches(units, cand_units[lang])
+                pairs += scored
+
+        score = 0.0
+        for side, units in sides.items():
+            if units:
+                langs = list(units)
+                score = max(score, clone_coverage(
+                    np.concatenate([units[lang] for lang in langs]),
+                    np.concatenate([best[side][lang] for lang in langs]),
+                ))
+        return score, pairs
+
+    @staticmethod
+    def _compare_uast(input_files, cand_files) -> Tuple[float, int]:
+        """
+        Cross-language UAST similarity of two repos: the best match
+        of every input file among candidate files of other languages,
+        averaged with the input files' subtree weights; and the number
+        of such pairs sharing a subtree. One index lookup per input
+        file instead of a nested loop.
+        """
+        if not input_files or not cand_files:
+            return 0.0, 0
+
+        index = SubtreeIndex([e for _, e in cand_files], [lang for lang, _ in cand_files])
+
+        total, weight, pairs = 0.0, 0.0, 0
+        for lang, entry in input_files:
+            scores = index.scores(entry)[index.groups != lang]
+            if not len(scores):
+                continue
+            w = float(entry[1].sum())
+            total += w * float(scores.max())
+            weight += w
+            pairs += int(np.count_nonzero(scores))
+        return (total / weight if weight else 0.0), pairs
@@ -0,0 +1,66 @@
+"""
+Benchmark: structural signatures (tree-sitter parse + traversal)
+with 1..N workers, in thread and process mode.
+
+Checks that every mode yields the same signatures as the serial run,
+then prints files/sec per worker count.
+
+Usage (from backend/):
+    python -m benchmarks.bench_parse <repo_path> [max_workers]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from agents.structural_agent import ALLOWED_EXTENSIONS, STRUCT_CLONES, parse_structures
+from preprocessing.snapshot import RepoSnapshot
+
+
+def same(a, b) -> bool:
+    if a is None or b is None or a == () or b == ():
+        return a == b
+    return all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    repo_path = sys.argv[1]
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    with RepoSnapshot(repo_path) as snapshot:
+        files = [f for f in snapshot.select(ALLOWED_EXTENSIONS) if f.language]
+        for f in files:
+            f.text   # read once, parsing is what is measured
+
+        counts = sorted({1, *[w for w in (2, 4, 8, 16, 32) if w < max_workers], max_workers})
+        print(f"files={len(files)} cpus={os.cpu_count()}")
+
+        reference = None
+        for mode in ("thread", "process"):
+            for workers in counts:
+                # warm-up: pool start and per-worker parser creation
+                parse_structures(files[: workers * 2], clones=STRUCT_CLONES, workers=workers, mode=mode)
+
+                start = time.perf_counter()
+                sigs = [s and s[0] for s in parse_structures(files, clones=STRUCT_CLONES, workers=workers, mode=mode)]
+                elapsed = time.perf_counter() - start
+
+                if reference is None:
+                    reference = sigs
+                assert all(same(a, b) for a, b in zip(reference, sigs)), f"{mode}/{workers}: signatures differ"
+                print(f"{mode:8s} workers={workers:3d} {len(files) / elapsed:9.1f} files/s ({elapsed:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+SimHash throughput benchmark: vectorized engine vs reference loop.
+
+Usage (from backend/):
+    python -m benchmarks.bench_simhash [repo_path]
+
+Without a repo path a synthetic token stream is used.
+"""
+import os
+import sys
+import time
+import random
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from fingerprinting.manager import iter_code_files
+from fingerprinting.simhash import (
+    normalize_code,
+    tokenize,
+    compute_simhash,
+    _compute_simhash_py,
+)
+
+
+def synthetic_tokens(n_tokens: int = 500_000, vocab: int = 50_000, seed: int = 7):
+    rnd = random.Random(seed)
+    words = [f"tok_{i}" for i in range(vocab)]
+    # zipf-ish distribution, like identifiers in real code
+    return [words[min(int(rnd.paretovariate(0.3)) - 1, vocab - 1)] for _ in range(n_tokens)]
+
+
+def repo_tokens(repo_path: str):
+    tokens = []
+    for path in iter_code_files(repo_path):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            tokens.extend(tokenize(normalize_code(f.read())))
+    return tokens
+
+
+def bench(fn, tokens, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(tokens)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    if len(sys.argv) > 1:
+        tokens = repo_tokens(sys.argv[1])
+    else:
+        tokens = synthetic_tokens()
+
+    distinct = len(set(tokens))
+    print(f"tokens={len(tokens)} distinct={distinct}")
+
+    ref = _compute_simhash_py(tokens)
+    fast = compute_simhash(tokens)
+    assert ref == fast, f"mismatch: {ref:#x} != {fast:#x}"
+
+    t_ref = bench(_compute_simhash_py, tokens)
+    t_fast = bench(compute_simhash, tokens)
+
+    print(f"reference : {t_ref * 1000:8.1f} ms  ({len(tokens) / t_ref / 1e6:6.2f} M tok/s)")
+    print(f"vectorized: {t_fast * 1000:8.1f} ms  ({len(tokens) / t_fast / 1e6:6.2f} M tok/s)")
+    print(f"speedup   : {t_ref / t_fast:.1f}x (bit-identical)")
+
+
+if __name__ == "__main__":
+    main()
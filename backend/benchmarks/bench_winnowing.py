@@ -0,0 +1,77 @@
+"""
+Winnowing window minima: O(n) block minima (window_minima) vs a
+sliding-window view (O(n*w)) vs the monotonic deque.
+
+Checks that all three select the same minima, then prints
+M hashes/sec per window size.
+
+Usage (from backend/):
+    python -m benchmarks.bench_winnowing [n_hashes] [windows]
+
+e.g. python -m benchmarks.bench_winnowing 1000000 4,8,16,64
+"""
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from fingerprinting.winnowing import window_minima
+
+
+def sliding_minima(values: np.ndarray, w: int) -> np.ndarray:
+    return np.lib.stride_tricks.sliding_window_view(values, w).min(axis=1)
+
+
+def deque_minima(values: np.ndarray, w: int) -> np.ndarray:
+    values = values.tolist()
+    window = deque()   # indices of increasing values
+    out = []
+    for i, v in enumerate(values):
+        while window and values[window[-1]] >= v:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - w:
+            window.popleft()
+        if i >= w - 1:
+            out.append(values[window[0]])
+    return np.array(out, dtype=np.uint64)
+
+
+def timed(fn, values, w, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(values, w)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    windows = [int(w) for w in sys.argv[2].split(",")] if len(sys.argv) > 2 else [4, 8, 16, 64]
+
+    values = np.random.default_rng(7).integers(0, 2**63, n, dtype=np.uint64)
+    engines = [("blocks", window_minima), ("sliding", sliding_minima), ("deque", deque_minima)]
+
+    print(f"{n} hashes, M hashes/sec")
+    print("w".rjust(5) + "".join(name.rjust(10) for name, _ in engines))
+    for w in windows:
+        expected = window_minima(values, w)
+        row = str(w).rjust(5)
+        for name, fn in engines:
+            if not np.array_equal(fn(values, w), expected):
+                raise SystemExit(f"{name} differs at w={w}")
+            row += f"{n / timed(fn, values, w) / 1e6:10.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Fuzz check: single-pass lexer vs normalize_code + tokenize.
+
+Generates random Python / JS / Java / C-like sources (comments in odd
+places, unterminated blocks, glued words, unicode) and asserts the
+legacy lexer yields exactly the same token stream. Then times both on
+a repo.
+
+Usage (from backend/):
+    python -m benchmarks.fuzz_lexer [n_cases] [repo_path]
+"""
+import os
+import sys
+import time
+import random
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from fingerprinting.lexer import lex
+from fingerprinting.manager import iter_code_files
+from fingerprinting.simhash import normalize_code, tokenize
+
+SNIPPETS = {
+    "python": [
+        "def f(x):\n", "    return x // 2\n", "# comment\n", "x = 'a#b'\n",
+        "class A_1(B):\n", "    pass\n", '"""doc /* not */ c"""\n', "0x1F + 12_000\n",
+    ],
+    "javascript": [
+        "const a = b / c;\n", "// line\n", "/* block */", "let re = /a\\/b/g;\n",
+        "function f() { return 1; }\n", "`tpl ${x}`\n", "a /* glue */ b\n", "url = 'http://x.y'\n",
+    ],
+    "java": [
+        "public class Foo {\n", "  int x = 42;\n", "  /** javadoc\n   * more\n   */\n",
+        "  void m() {}\n", "}\n", "@Override\n", "List<String> xs;\n",
+    ],
+    "c": [
+        "#include <stdio.h>\n", "#define N 10\n", "int main(void) {\n", "  return 0;\n",
+        "}\n", "a/**/b", "1/**/2", "/* unterminated", "*/", "x /* a\n b */ y\n",
+    ],
+}
+
+NOISE = [
+    "/*", "*/", "//", "#", "/", "*", "\n", " ", "\t", "é", "ß", "٣", "_", "9",
+    "ab", "x1", "12", "/**/", "/***/", "/* # */", "# /* ", "\r\n", "\"", "'",
+]
+
+
+def random_source(rnd: random.Random, language: str) -> str:
+    parts = []
+    for _ in range(rnd.randint(1, 40)):
+        if rnd.random() < 0.6:
+            parts.append(rnd.choice(SNIPPETS[language]))
+        else:
+            parts.append(rnd.choice(NOISE))
+    return "".join(parts)
+
+
+def fuzz(n_cases: int, seed: int = 0) -> int:
+    rnd = random.Random(seed)
+    failures = 0
+
+    for i in range(n_cases):
+        language = rnd.choice(list(SNIPPETS))
+        text = random_source(rnd, language)
+        expected = tokenize(normalize_code(text))
+        got = lex(text)
+        if got != expected:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH [{language}] {text!r}\n  expected={expected}\n  got     ={got}")
+
+    print(f"cases={n_cases} failures={failures}")
+    return failures
+
+
+def bench(repo_path: str):
+    texts = []
+    for path in iter_code_files(repo_path):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            texts.append(f.read())
+
+    start = time.perf_counter()
+    old = [tokenize(normalize_code(t)) for t in texts]
+    t_old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = [lex(t) for t in texts]
+    t_new = time.perf_counter() - start
+
+    assert old == new, "token streams differ"
+    print(f"files={len(texts)} normalize+tokenize={t_old:.3f}s lexer={t_new:.3f}s speedup={t_old / t_new:.2f}x")
+
+
+def main():
+    n_cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    failures = fuzz(n_cases)
+
+    if len(sys.argv) > 2:
+        bench(sys.argv[2])
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ from agents.semantic_agent import SemanticAgent
 from agents.contributor_agent import ContributorAgent
 
 from core.aggregator import aggregate_multiple_repos
+from core.utils import timed
+from preprocessing.snapshot import RepoSnapshot
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,10 @@ class Orchestrator:
     2. Rank DB repos using fingerprint similarity
     3. Select TOP-K candidates
     4. Run agents conditionally based on thresholds
+
+    Steps 1-3 are skipped when the caller already did them
+    (input_fp / ranked), so a task fingerprints the input once.
+    Every repo is read once into a RepoSnapshot that all agents share.
     """
 
     def __init__(self):
@@ -31,177 +37,189 @@ class Orchestrator:
         input_repo_url: str,
         input_path: str,
         repo_paths: dict,        # {repo_url: local_path}
-        db_candidates: list,     # [{repo_url, simhash, winnowing, token_count}]
+        db_candidates: list = None,  # [{repo_url, simhash, winnowing, token_count}]
         top_k: int = 3,
         simhash_threshold: float = 0.05,
         winnowing_threshold: float = 0.05,
         force_heavy: bool = False,
+        snapshots: dict = None,  # {repo_url: RepoSnapshot} built by the caller
+        input_fp: dict = None,   # fingerprint from ingest_repo, skips PHASE 0
+        ranked: list = None,     # compare_many results, best first, skips PHASE 1
+        timings: dict = None,    # {phase: seconds}, filled in place
     ):
-        # --------------------------------------------------
-        # PHASE 0: Ingest input repo
-        # --------------------------------------------------
-        input_fp = self.fingerprint_agent.ingest_repo(
-            input_repo_url,
-            input_path,
-        )
-
-        # --------------------------------------------------
-        # PHASE 1: Fingerprint-only ranking
-        # --------------------------------------------------
-        ranked = []
-
-        for cand in db_candidates:
-            try:
-                fp_score = self.fingerprint_agent.compare_with_db(
-                    input_fp,
-                    cand,
-                )
-            except Exception:
-                logger.exception(f"[FP ERROR] {cand.get('repo_url')}")
-                continue
-
-            ranked.append({
-                "repo_url": cand["repo_url"],
-                "fp": fp_score,
-            })
-
-        ranked.sort(
-            key=lambda x: (
-                x["fp"].get("simhash_score", 0.0)
-                + x["fp"].get("winnowing_score", 0.0)
-            ),
-            reverse=True,
-        )
-
-        ranked = [
-            r for r in ranked
-            if r["repo_url"] != input_repo_url
-        ]
-
-        top_candidates = ranked[:top_k]
-
-        logger.info(
-            f"[ORCH] TOP-{top_k} candidates: "
-            f"{[c['repo_url'] for c in top_candidates]}"
-        )
-
-        # --------------------------------------------------
-        # PHASE 2: Conditional Agent Execution
-        # --------------------------------------------------
-        aggregated_results = {}
-
-        for item in top_candidates:
-            cand_url = item["repo_url"]
-            fp_res = item["fp"]
-            cand_path = repo_paths.get(cand_url)
-
-            agent_scores = []
-
-            # -------------------------------
-            # Fingerprint (ALWAYS)
-            # -------------------------------
-            agent_scores.append(fp_res)
-
-            simhash_score = fp_res.get("simhash_score", 0.0)
-            winnowing_score = fp_res.get("winnowing_score", 0.0)
-
-            deep_allowed = (
-                force_heavy or
-                (
-                    simhash_score >= simhash_threshold
-                    and winnowing_score >= winnowing_threshold
-                )
+        timings = {} if timings is None else timings
+        snapshots = dict(snapshots or {})
+        owned = []
+
+        def snapshot_for(url, path):
+            if url not in snapshots and path:
+                snapshots[url] = RepoSnapshot(path)
+                owned.append(snapshots[url])
+            return snapshots.get(url)
+
+        input_snap = snapshot_for(input_repo_url, input_path)
+
+        try:
+            # --------------------------------------------------
+            # PHASE 0: Ingest input repo (unless done by the caller)
+            # --------------------------------------------------
+            if ranked is None and input_fp is None:
+                with timed(timings, "ingest"):
+                    input_fp = self.fingerprint_agent.ingest_repo(
+                        input_repo_url,
+                        input_snap,
+                    )
+
+            # --------------------------------------------------
+            # PHASE 1: Fingerprint-only ranking (unless done by the caller)
+            # --------------------------------------------------
+            if ranked is None:
+                with timed(timings, "rank"):
+                    ranked = self.fingerprint_agent.compare_many(
+                        input_fp,
+                        [c for c in db_candidates or [] if c["repo_url"] != input_repo_url],
+                        top_k=top_k,
+                    )
+
+            top_candidates = [
+                {"repo_url": fp_score["details"]["candidate_repo"], "fp": fp_score}
+                for fp_score in ranked
+                if fp_score["details"]["candidate_repo"] != input_repo_url
+            ][:top_k]
+
+            logger.info(
+                f"[ORCH] TOP-{top_k} candidates: "
+                f"{[c['repo_url'] for c in top_candidates]}"
             )
 
-            # -------------------------------
-            # Structural Agent
-            # -------------------------------
-            if cand_path and deep_allowed:
-                try:
-                    agent_scores.append(
-                        self.structural_agent.run(
-                            input_path,
-                            cand_path,
-                            simhash_score=simhash_score,
-                        )
+            # --------------------------------------------------
+            # PHASE 2: Conditional Agent Execution
+            # --------------------------------------------------
+            aggregated_results = {}
+
+            for item in top_candidates:
+                cand_url = item["repo_url"]
+                fp_res = item["fp"]
+                cand_snapshot = snapshot_for(cand_url, repo_paths.get(cand_url))
+
+                agent_scores = []
+
+                # -------------------------------
+                # Fingerprint (ALWAYS)
+                # -------------------------------
+                agent_scores.append(fp_res)
+
+                simhash_score = fp_res.get("simhash_score", 0.0)
+                winnowing_score = fp_res.get("winnowing_score", 0.0)
+
+                deep_allowed = (
+                    force_heavy or
+                    (
+                        simhash_score >= simhash_threshold
+                        and winnowing_score >= winnowing_threshold
                     )
-                except Exception:
-                    logger.exception(f"[STRUCTURAL ERROR] {cand_url}")
+                )
+
+                # -------------------------------
+                # Structural Agent
+                # -------------------------------
+                if cand_snapshot and deep_allowed:
+                    try:
+                        with timed(timings, "structural"):
+                            agent_scores.append(
+                                self.structural_agent.run(
+                                    input_snap,
+                                    cand_snapshot,
+                                    simhash_score=simhash_score,
+                                )
+                            )
+                    except Exception:
+                        logger.exception(f"[STRUCTURAL ERROR] {cand_url}")
+                        agent_scores.append({
+                            "agent": "structural",
+                            "score": 0.0,
+                            "details": {
+                                "status": "error",
+                                "reason": "structural_exception",
+                            },
+                        })
+                else:
                     agent_scores.append({
                         "agent": "structural",
                         "score": 0.0,
                         "details": {
-                            "status": "error",
-                            "reason": "structural_exception",
+                            "status": "skipped",
+                            "reason": "fingerprint_below_threshold",
+                            "simhash": simhash_score,
+                            "winnowing": winnowing_score,
                         },
                     })
-            else:
-                agent_scores.append({
-                    "agent": "structural",
-                    "score": 0.0,
-                    "details": {
-                        "status": "skipped",
-                        "reason": "fingerprint_below_threshold",
-                        "simhash": simhash_score,
-                        "winnowing": winnowing_score,
-                    },
-                })
-
-            # -------------------------------
-            # Semantic Agent
-            # -------------------------------
-            if cand_path and deep_allowed:
+
+                # -------------------------------
+                # Semantic Agent
+                # -------------------------------
+                if cand_snapshot and deep_allowed:
+                    try:
+                        with timed(timings, "semantic"):
+                            agent_scores.append(
+                                self.semantic_agent.run(
+                                    input_snap,
+                                    cand_snapshot,
+                                )
+                            )
+                    except Exception:
+                        logger.exception(f"[SEMANTIC ERROR] {cand_url}")
+                        agent_scores.append({
+                            "agent": "semantic",
+                            "score": 0.0,
+                            "details": {
+                                "status": "error",
+                                "reason": "semantic_exception",
+                            },
+                        })
+                else:
+                    agent_scores.append({
+                        "agent": "semantic",
+                        "score": 0.0,
+                        "details": {
+                            "status": "skipped",
+                            "reason": "fingerprint_below_threshold",
+                        },
+                    })
+
+                # -------------------------------
+                # Contributor Agent (ALWAYS)
+                # -------------------------------
                 try:
-                    agent_scores.append(
-                        self.semantic_agent.run(
-                            input_path,
-                            cand_path,
+                    with timed(timings, "contributor"):
+                        agent_scores.append(
+                            self.contributor_agent.run(
+                                input_snap,
+                                cand_snapshot,
+                            )
                         )
-                    )
                 except Exception:
-                    logger.exception(f"[SEMANTIC ERROR] {cand_url}")
+                    logger.exception(f"[CONTRIBUTOR ERROR] {cand_url}")
                     agent_scores.append({
-                        "agent": "semantic",
+                        "agent": "contributor",
                         "score": 0.0,
                         "details": {
                             "status": "error",
-                            "reason": "semantic_exception",
+                            "reason": "contributor_exception",
                         },
                     })
-            else:
-                agent_scores.append({
-                    "agent": "semantic",
-                    "score": 0.0,
-                    "details": {
-                        "status": "skipped",
-                        "reason": "fingerprint_below_threshold",
-                    },
-                })
-
-            # -------------------------------
-            # Contributor Agent (ALWAYS)
-            # -------------------------------
-            try:
-                agent_scores.append(
-                    self.contributor_agent.run(
-                        input_path,
-                        cand_path,
-                    )
-                )
-            except Exception:
-                logger.exception(f"[CONTRIBUTOR ERROR] {cand_url}")
-                agent_scores.append({
-                    "agent": "contributor",
-                    "score": 0.0,
-                    "details": {
-                        "status": "error",
-                        "reason": "contributor_exception",
-                    },
-                })
-
-            aggregated_results[cand_url] = agent_scores
-
-        # --------------------------------------------------
-        # FINAL: Aggregate scores
-        # --------------------------------------------------
-        return aggregate_multiple_repos(aggregated_results)
+
+                aggregated_results[cand_url] = agent_scores
+
+            # --------------------------------------------------
+            # FINAL: Aggregate scores
+            # --------------------------------------------------
+            with timed(timings, "aggregate"):
+                result = aggregate_multiple_repos(aggregated_results)
+
+            result["timings"] = {k: round(v, 4) for k, v in timings.items()}
+            return result
+
+        finally:
+            for snapshot in owned:
+                snapshot.close()
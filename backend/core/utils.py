@@ -1,5 +1,7 @@
 import os
+import time
 import hashlib
+from contextlib import contextmanager
 
 def compute_file_hash(filepath):
     """Compute SHA256 hash of a file (useful for FingerprintAgent)."""
@@ -19,3 +21,14 @@ def list_all_files(base_path):
         for f in files:
             paths.append(os.path.join(root, f))
     return paths
+
+
+@contextmanager
+def timed(timings, phase):
+    """Add the wall time of the block to timings[phase] (seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
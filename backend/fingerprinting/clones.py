@@ -0,0 +1,206 @@
+# fingerprinting/clones.py
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from .lsh import band_matrix, bucket_pairs
+from .structure import type_bigrams
+from .uast.uast_builder import NODE_MAP
+from .uast.uast_nodes import UASTNodeType
+
+# ------------------------------------------------------
+# Function-level clone detection (Deckard, Jiang et al. 2007)
+#
+# Every FUNCTION / CLASS node of NODE_MAP is a unit. A unit's
+# characteristic vector counts the node-type bigrams (as in the file
+# signature) of its subtree, hashed into CLONE_DIMS buckets, so a
+# function copied into a large file keeps its own vector instead of
+# being diluted in the file's. Plain type counts are too alike: most
+# unrelated stdlib functions have a match above 0.85 by type counts,
+# ~1% above 0.9 by bigram counts.
+#
+# Two units score 1 - L1(u - v) / L1(u + v) (1 for equal counts).
+# Units below CLONE_MIN_NODES named nodes are ignored: small
+# accessors and constructors look alike everywhere.
+#
+# Two repos score by clone coverage, not by their best pair: the share
+# of one repo's unit mass (bigram counts) whose best match in the other
+# is >= CLONE_MIN_SIMILARITY, the larger of the two shares. A function
+# copied into a large repo covers the small one; a few look-alike
+# wrappers between unrelated stdlib packages cover ~1% of either.
+# ------------------------------------------------------
+CLONE_DIMS = int(os.getenv("CLONE_DIMS", "128"))
+CLONE_MIN_NODES = int(os.getenv("CLONE_MIN_NODES", "40"))
+
+# unit matches below this do not count as clones
+CLONE_MIN_SIMILARITY = float(os.getenv("CLONE_MIN_SIMILARITY", "0.9"))
+
+# ------------------------------------------------------
+# Euclidean LSH (p-stable, Datar et al. 2004)
+#
+# Over L2-normalized vectors, h(v) = floor((a . v + b) / WIDTH) with
+# Gaussian a, ROWS hashes per band; as Deckard groups vectors by size,
+# every band also hashes log(unit size) in steps of SIZE_WIDTH.
+# Units sharing a band bucket are scored. On 3000 stdlib units,
+# 40 x 4 proposes ~2% of the pairs, with recall ~0.86 at similarity
+# 0.8 and 1.0 at 0.9. Fewer than CLONE_LSH_MIN_PAIRS pairs are
+# scored exhaustively (0 disables LSH).
+# ------------------------------------------------------
+CLONE_LSH_BANDS = int(os.getenv("CLONE_LSH_BANDS", "40"))
+CLONE_LSH_ROWS = int(os.getenv("CLONE_LSH_ROWS", "4"))
+CLONE_LSH_WIDTH = float(os.getenv("CLONE_LSH_WIDTH", "0.35"))
+CLONE_LSH_SIZE_WIDTH = float(os.getenv("CLONE_LSH_SIZE_WIDTH", "0.8"))
+CLONE_LSH_MIN_PAIRS = int(os.getenv("CLONE_LSH_MIN_PAIRS", "1000000"))
+
+# tree-sitter types that start a unit
+UNIT_TYPES = frozenset(
+    ts_type for ts_type, kind in NODE_MAP.items()
+    if kind in (UASTNodeType.FUNCTION, UASTNodeType.CLASS)
+)
+
+_BLOCK_ROWS = 1024
+
+
+def unit_vectors(
+    hashes: np.ndarray,
+    spans: List[Tuple[int, int]],
+    dims: int = CLONE_DIMS,
+    min_nodes: int = CLONE_MIN_NODES,
+) -> np.ndarray:
+    """
+    (units, dims) float32 characteristic vectors of the unit spans of
+    at least min_nodes; hashes and spans as node_type_hashes and
+    structure.named_node_spans (with UNIT_TYPES) give them.
+    """
+    spans = [(s, e) for s, e in spans if e - s >= max(min_nodes, 2)]
+    if not spans:
+        return np.empty((0, dims), dtype=np.float32)
+
+    # bigram k pairs nodes k and k + 1: a span's are [s, e - 1)
+    buckets = (type_bigrams(hashes) % np.uint64(dims)).astype(np.int64)
+    return np.stack(
+        [np.bincount(buckets[s : e - 1], minlength=dims) for s, e in spans]
+    ).astype(np.float32)
+
+
+def _similarity(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """1 - L1(u - v) / L1(u + v) of every left x right pair."""
+    dist = cdist(left, right, "cityblock")
+    total = left.sum(axis=1)[:, None] + right.sum(axis=1)[None, :]
+    return 1.0 - np.divide(dist, total, out=np.ones_like(dist), where=total > 0)
+
+
+_projections: Dict[Tuple, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+
+def _projection(dims: int, bands: int, rows: int, width: float, size_width: float):
+    """Fixed (a, b, size offsets) of the hash functions (seeded)."""
+    key = (dims, bands, rows, width, size_width)
+    if key not in _projections:
+        rng = np.random.default_rng(1)
+        _projections[key] = (
+            rng.standard_normal((dims, bands * rows)),
+            rng.uniform(0.0, width, bands * rows),
+            rng.uniform(0.0, size_width, bands),
+        )
+    return _projections[key]
+
+
+class CloneIndex:
+    """
+    Euclidean LSH over unit vectors. Built once over the units of one
+    repo, then queried with the units of another.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        bands: int = CLONE_LSH_BANDS,
+        rows: int = CLONE_LSH_ROWS,
+        width: float = CLONE_LSH_WIDTH,
+        size_width: float = CLONE_LSH_SIZE_WIDTH,
+    ):
+        self.vectors = vectors
+        self.bands, self.rows = bands, rows
+        self.width, self.size_width = width, size_width
+        self.keys = self._band_keys(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _band_keys(self, vectors: np.ndarray) -> np.ndarray:
+        n, bands, rows = len(vectors), self.bands, self.rows
+        a, b, offsets = _projection(vectors.shape[1], bands, rows, self.width, self.size_width)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = np.divide(vectors, norms, out=np.zeros(vectors.shape), where=norms > 0)
+        h = np.floor((unit @ a + b) / self.width).astype(np.int64)
+
+        # one size hash appended to the rows of every band
+        log_size = np.log(np.maximum(vectors.sum(axis=1), 1.0))
+        size = np.floor((log_size[:, None] + offsets) / self.size_width).astype(np.int64)
+        h = np.concatenate([h.reshape(n, bands, rows), size[:, :, None]], axis=2)
+        return band_matrix(h.reshape(n, -1).view(np.uint64), bands, rows + 1)
+
+    def candidates(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(query unit, indexed unit) pairs sharing a band bucket."""
+        return bucket_pairs(self._band_keys(vectors), self.keys)
+
+    def pair_similarity(self, vectors: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """Similarity of the pairs (vectors[i[k]], self.vectors[j[k]])."""
+        left, right = vectors[i], self.vectors[j]
+        total = left.sum(axis=1) + right.sum(axis=1)
+        dist = np.abs(left - right).sum(axis=1)
+        return 1.0 - np.divide(dist, total, out=np.ones_like(dist), where=total > 0)
+
+
+def best_matches(
+    left: np.ndarray,
+    right: np.ndarray,
+    min_lsh_pairs: int = CLONE_LSH_MIN_PAIRS,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Best similarity of every left unit among the right units, of every
+    right unit among the left ones (0 without a candidate), and the
+    number of pairs scored: all pairs when there are few, else the LSH
+    candidates.
+    """
+    left_best = np.zeros(len(left))
+    right_best = np.zeros(len(right))
+    n_pairs = len(left) * len(right)
+    if not n_pairs:
+        return left_best, right_best, 0
+
+    if not min_lsh_pairs or n_pairs < min_lsh_pairs:
+        for start in range(0, len(left), _BLOCK_ROWS):
+            sim = _similarity(left[start : start + _BLOCK_ROWS], right)
+            left_best[start : start + len(sim)] = sim.max(axis=1)
+            np.maximum(right_best, sim.max(axis=0), out=right_best)
+        return left_best, right_best, n_pairs
+
+    index = CloneIndex(right)
+    i, j = index.candidates(left)
+    scores = index.pair_similarity(left, i, j)
+    np.maximum.at(left_best, i, scores)
+    np.maximum.at(right_best, j, scores)
+    return left_best, right_best, len(i)
+
+
+def clone_coverage(
+    vectors: np.ndarray,
+    best: np.ndarray,
+    min_similarity: float = CLONE_MIN_SIMILARITY,
+) -> float:
+    """
+    Share of the units' bigram mass that has a clone: the similarity of
+    every unit whose best match is >= min_similarity, weighted by its
+    size, over the size of all units.
+    """
+    sizes = vectors.sum(axis=1, dtype=np.float64)
+    total = float(sizes.sum())
+    if total <= 0:
+        return 0.0
+    matched = best >= min_similarity
+    return float((sizes[matched] * best[matched]).sum()) / total
@@ -0,0 +1,92 @@
+# fingerprinting/hamming_index.py
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# ------------------------------------------------------
+# Multi-index Hamming search (Manku, Jain, Das Sarma 2007)
+#
+# Split the 64-bit SimHash into d+1 blocks. Two hashes within
+# Hamming distance d differ in at most d blocks, so they agree
+# exactly on at least one block (pigeonhole). One table per
+# block maps block value -> entries; a query probes d+1 tables
+# and verifies only the few entries sharing a block.
+# ------------------------------------------------------
+SIMHASH_MAX_DISTANCE = 3
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Set bits per uint64 element (np.bitwise_count on NumPy >= 2)."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def hamming_distances(simhash: int, simhashes: np.ndarray) -> np.ndarray:
+    """Hamming distance from simhash to every entry of a uint64 array."""
+    return popcount64(np.bitwise_xor(simhashes, np.uint64(simhash)))
+
+
+class SimHashIndex:
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE, hash_bits: int = 64):
+        self.max_distance = max_distance
+        self.hash_bits = hash_bits
+
+        # (shift, mask) per block, blocks as even as possible
+        n_blocks = max_distance + 1
+        self._blocks = []
+        start = 0
+        for i in range(n_blocks):
+            width = hash_bits // n_blocks + (1 if i < hash_bits % n_blocks else 0)
+            self._blocks.append((start, (1 << width) - 1))
+            start += width
+
+        self._tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in self._blocks]
+        self._simhashes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._simhashes)
+
+    def __contains__(self, repo_id: int):
+        return repo_id in self._simhashes
+
+    def insert(self, repo_id: int, simhash: int):
+        """Add repo_id, or replace its SimHash if already indexed."""
+        with self._lock:
+            previous = self._simhashes.get(repo_id)
+            if previous == simhash:
+                return
+            for table, (shift, mask) in zip(self._tables, self._blocks):
+                if previous is not None:
+                    table[(previous >> shift) & mask].remove(repo_id)
+                table[(simhash >> shift) & mask].append(repo_id)
+            self._simhashes[repo_id] = simhash
+
+    def query(self, simhash: int, max_distance: int = None) -> List[Tuple[int, int]]:
+        """
+        All repos within max_distance bits of simhash.
+        Returns [(repo_id, distance)], closest first.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(
+                f"index built for distance <= {self.max_distance}, got {max_distance}"
+            )
+
+        found = {}
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            for repo_id in table.get((simhash >> shift) & mask, ()):
+                if repo_id in found:
+                    continue
+                distance = (self._simhashes[repo_id] ^ simhash).bit_count()
+                if distance <= max_distance:
+                    found[repo_id] = distance
+
+        return sorted(found.items(), key=lambda x: (x[1], x[0]))
@@ -0,0 +1,188 @@
+# fingerprinting/lexer.py
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .simhash import token_hashes
+
+# ------------------------------------------------------
+# Single-pass lexer
+#
+# One precompiled scan per language strips comments and emits
+# identifier / number tokens in the same pass, instead of three
+# re.sub copies (normalize_code) followed by re.findall (tokenize).
+#
+# The "legacy" lexer reproduces tokenize(normalize_code(text))
+# token for token, so stored fingerprints stay comparable:
+# - // and /* */ are removed first, then # to the end of the
+#   remaining line (which can pull in lines after a block comment)
+# - removing a block comment glues the words around it
+#   ("foo/**/bar" -> "foobar", "1/**/2" -> "12")
+# ------------------------------------------------------
+_BLOCK = r"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
+_LINE = r"//[^\n]*"
+_HASH = r"#[^\n]*"
+_HASH_AFTER_C = rf"#(?:{_LINE}|{_BLOCK}|[^\n])*"
+_HTML = r"<!--.*?-->"
+
+_IDENT = r"[A-Za-z_]\w*"
+_NUMBER = r"\d+"
+
+_BLOCK_RE = re.compile(_BLOCK)
+
+
+class Lexer:
+    """
+    Comment-aware tokenizer for one language family.
+
+    comments: comment patterns, tried in order at every position
+    glue: block comments join adjacent words (legacy behaviour)
+    """
+
+    def __init__(self, name: str, comments: Iterable[str], glue: bool = False):
+        self.name = name
+        self.comments = tuple(comments)
+        self.glue = glue
+
+        ident, number = _IDENT, _NUMBER
+        if glue:
+            ident = rf"{_IDENT}(?:(?:{_BLOCK})+\w+)*"
+            number = rf"{_NUMBER}(?:(?:{_BLOCK})+\d+)*"
+
+        # every alternative starts with a different character class,
+        # so tokens go first (most frequent match)
+        self._scan = re.compile(
+            f"({ident}|{number})|" + "|".join(f"(?:{c})" for c in self.comments),
+            re.DOTALL,
+        )
+        self._comments = re.compile("|".join(self.comments), re.DOTALL)
+
+    def tokens(self, text: str) -> List[str]:
+        """Identifier / number tokens with comments removed."""
+        out = [t for t in self._scan.findall(text) if t]
+        if self.glue and "/*" in text:
+            out = [_BLOCK_RE.sub("", t) if "/*" in t else t for t in out]
+        return out
+
+    def ids(self, text: str, vocab: "Vocabulary") -> np.ndarray:
+        """tokens() as interned uint32 ids."""
+        return vocab.intern_many(self.tokens(text))
+
+    def strip_comments(self, text: str) -> str:
+        return self._comments.sub("", text)
+
+
+# ------------------------------------------------------
+# Token interning
+# ------------------------------------------------------
+VOCAB_MAX_TOKENS = int(os.getenv("VOCAB_MAX_TOKENS", "5000000"))
+
+
+class Vocabulary:
+    """
+    Token string <-> dense uint32 id.
+
+    The 64-bit hash of every token (low 64 bits of its md5, the value
+    SimHash and v2 winnowing use) is computed once, when the token is
+    first interned; hash_array()[ids] gives the hashes of a stream.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def intern(self, token: str) -> int:
+        return int(self.intern_many([token])[0])
+
+    def intern_many(self, tokens: Iterable[str]) -> np.ndarray:
+        ids = self._ids
+        out = []
+        new: List[str] = []
+
+        with self._lock:
+            for token in tokens:
+                token_id = ids.get(token)
+                if token_id is None:
+                    token_id = ids[token] = len(self._tokens)
+                    self._tokens.append(token)
+                    new.append(token)
+                out.append(token_id)
+
+            if new:
+                self._store_hashes(len(self._tokens) - len(new), token_hashes(new))
+
+        return np.array(out, dtype=np.uint32)
+
+    def _store_hashes(self, start: int, hashes: np.ndarray):
+        end = start + len(hashes)
+        if end > len(self._hashes):
+            grown = np.empty(max(end, 2 * len(self._hashes)), dtype=np.uint64)
+            grown[:start] = self._hashes[:start]
+            self._hashes = grown
+        self._hashes[start:end] = hashes
+
+    def hash_array(self) -> np.ndarray:
+        """Per-id 64-bit token hashes (index with an id stream)."""
+        return self._hashes[: len(self._tokens)]
+
+    def token(self, token_id: int) -> str:
+        return self._tokens[token_id]
+
+    def tokens_of(self, ids: Iterable[int]) -> List[str]:
+        tokens = self._tokens
+        return [tokens[i] for i in ids]
+
+
+_vocabulary = Vocabulary()
+
+
+def get_vocabulary() -> Vocabulary:
+    """
+    Process-wide vocabulary. Ids are only meaningful within the
+    Vocabulary object that produced them: callers fetch it once per
+    unit of work. Past VOCAB_MAX_TOKENS a fresh one is started.
+    """
+    global _vocabulary
+    if len(_vocabulary) > VOCAB_MAX_TOKENS:
+        _vocabulary = Vocabulary()
+    return _vocabulary
+
+
+# ------------------------------------------------------
+# Profiles (keys follow parsing.language_detector)
+# ------------------------------------------------------
+LEGACY = Lexer("legacy", [_LINE, _BLOCK, _HASH_AFTER_C], glue=True)
+
+_PYTHON = Lexer("python", [_HASH])
+_C_FAMILY = Lexer("c", [_LINE, _BLOCK])
+
+LEXERS: Dict[str, Lexer] = {
+    "python": _PYTHON,
+    "c": _C_FAMILY,
+    "cpp": _C_FAMILY,
+    "java": _C_FAMILY,
+    "javascript": _C_FAMILY,
+    "typescript": _C_FAMILY,
+    "tsx": _C_FAMILY,
+}
+
+# comment syntax of every supported language, for text cleaning
+GENERIC = Lexer("generic", [_LINE, _BLOCK, _HASH, _HTML])
+
+
+def get_lexer(language: Optional[str] = None) -> Lexer:
+    """Language-specific lexer, the legacy one for unknown languages."""
+    return LEXERS.get(language, LEGACY)
+
+
+def lex(text: str) -> List[str]:
+    """Fingerprinting tokens, identical to tokenize(normalize_code(text))."""
+    return LEGACY.tokens(text)
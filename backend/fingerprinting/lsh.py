@@ -0,0 +1,205 @@
+# fingerprinting/lsh.py
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from .winnowing import _mix64
+
+# ------------------------------------------------------
+# MinHash LSH over winnowing hashes
+#
+# A pair with Jaccard s shares at least one band with
+# probability 1 - (1 - s^ROWS)^BANDS. Tuned for recall, since
+# plagiarised repos often overlap only partially:
+#   s=0.05 -> ~0.15, s=0.1 -> ~0.47, s=0.2 -> ~0.93
+# ------------------------------------------------------
+NUM_PERM = 128
+LSH_BANDS = 64
+LSH_ROWS = 2
+
+_MAX64 = np.iinfo(np.uint64).max
+_CHUNK = 4096
+
+
+class MinHasher:
+    """
+    Vectorized MinHash with multiply-shift hash functions
+    h_i(x) = (a_i * x + b_i) mod 2^64, keeping the high 32 bits.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, _MAX64, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self.b = rng.integers(0, _MAX64, size=num_perm, dtype=np.uint64, endpoint=True)
+
+    def signature(self, hashes: Iterable[int]) -> np.ndarray:
+        values = np.asarray(
+            hashes if isinstance(hashes, np.ndarray) else list(hashes),
+            dtype=np.uint64,
+        )
+        sig = np.full(self.num_perm, _MAX64, dtype=np.uint64)
+
+        # chunked so memory stays at num_perm x _CHUNK
+        for start in range(0, len(values), _CHUNK):
+            chunk = values[start : start + _CHUNK]
+            permuted = (np.multiply.outer(self.a, chunk) + self.b[:, None]) >> np.uint64(32)
+            np.minimum(sig, permuted.min(axis=1), out=sig)
+
+        return sig
+
+    def signatures(self, sets: List[np.ndarray]) -> np.ndarray:
+        """
+        signature() of many uint64 sets at once, as an (n, num_perm)
+        matrix: sets are packed into chunks of about _CHUNK values and
+        each chunk reduced per set. Empty sets keep the all-max row.
+        """
+        out = np.full((len(sets), self.num_perm), _MAX64, dtype=np.uint64)
+        rows = [i for i, s in enumerate(sets) if len(s)]
+
+        start = 0
+        while start < len(rows):
+            stop, size = start, 0
+            while stop < len(rows) and (size == 0 or size + len(sets[rows[stop]]) <= _CHUNK):
+                size += len(sets[rows[stop]])
+                stop += 1
+
+            group = rows[start:stop]
+            values = np.concatenate([np.asarray(sets[i], dtype=np.uint64) for i in group])
+            offsets = np.zeros(len(group), dtype=np.int64)
+            np.cumsum([len(sets[i]) for i in group[:-1]], out=offsets[1:])
+
+            permuted = (np.multiply.outer(self.a, values) + self.b[:, None]) >> np.uint64(32)
+            out[group] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = stop
+
+        return out
+
+
+def band_keys(
+    signature: np.ndarray,
+    bands: int = LSH_BANDS,
+    rows: int = LSH_ROWS,
+    fp_version: int = 1,
+) -> List[int]:
+    """
+    One signed 64-bit bucket key per band (fits a Postgres BIGINT).
+    The fingerprint version is mixed in so v1 / v2 never share buckets.
+    """
+    prefix = fp_version.to_bytes(2, "little")
+    keys = []
+    for band in range(bands):
+        chunk = signature[band * rows : (band + 1) * rows].tobytes()
+        digest = hashlib.blake2b(prefix + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+_BAND_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def band_matrix(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """
+    (n, bands) uint64 bucket keys of (n, bands * rows) MinHash
+    signatures, vectorized; for in-memory banding (band_keys is
+    the stored, versioned form).
+    """
+    chunks = signatures[:, : bands * rows].reshape(len(signatures), bands, rows)
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    for r in range(rows):
+        keys = keys * _BAND_MULT + chunks[:, :, r]
+    return _mix64(keys)
+
+
+def bucket_pairs(left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (i, j) index arrays of the left x right rows sharing a bucket in
+    at least one band (band_matrix outputs), unique, sorted by i then j.
+    """
+    n_right = len(right)
+    codes = []
+    for band in range(left.shape[1] if len(left) else 0):
+        order = np.argsort(right[:, band], kind="stable")
+        keys = right[order, band]
+        lo = np.searchsorted(keys, left[:, band], side="left")
+        hi = np.searchsorted(keys, left[:, band], side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            continue
+
+        # expand every [lo, hi) range into (i, j) pairs
+        i = np.repeat(np.arange(len(left), dtype=np.int64), counts)
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        j = order[starts + np.arange(total)]
+        codes.append(i * n_right + j)
+
+    if not codes:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    codes = np.unique(np.concatenate(codes))
+    return codes // n_right, codes % n_right
+
+
+class LSHIndex:
+    """
+    In-memory banded LSH table: (band, bucket) -> repo ids.
+    Used as the worker-side mirror of the lsh_bands table.
+
+    Inserting a repo again replaces its bands, so rows can be
+    re-read (and re-banded repos updated) without duplicates.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._keys: Dict[int, Dict[int, int]] = {}
+        self._lock = threading.Lock()
+        self.loaded_txid = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, repo_id: int):
+        return repo_id in self._keys
+
+    def _replace(self, repo_id: int, keys: Dict[int, int]):
+        for band, bucket in self._keys.pop(repo_id, {}).items():
+            members = self._buckets.get((band, bucket))
+            if members is not None:
+                members.discard(repo_id)
+                if not members:
+                    del self._buckets[(band, bucket)]
+        for band, bucket in keys.items():
+            self._buckets[(band, bucket)].add(repo_id)
+        self._keys[repo_id] = keys
+
+    def insert(self, repo_id: int, keys: List[int]):
+        with self._lock:
+            self._replace(repo_id, dict(enumerate(keys)))
+
+    def insert_rows(self, rows: Iterable[Tuple[int, int, int]]):
+        """
+        rows of (repo_id, band, bucket), as stored in Postgres,
+        every band of each repo present.
+        """
+        by_repo: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for repo_id, band, bucket in rows:
+            by_repo[repo_id][band] = bucket
+
+        with self._lock:
+            for repo_id, keys in by_repo.items():
+                self._replace(repo_id, keys)
+
+    def query(self, keys: List[int], limit: int = 50) -> List[Tuple[int, int]]:
+        """
+        Repos sharing at least one band, most shared bands first.
+        Returns [(repo_id, shared_bands)].
+        """
+        hits = Counter()
+        for band, bucket in enumerate(keys):
+            hits.update(self._buckets.get((band, bucket), ()))
+        return hits.most_common(limit)
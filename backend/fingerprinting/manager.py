@@ -1,27 +1,301 @@
 # fingerprinting/manager.py
 import os
-from typing import Dict, Any, List
+import sys
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Dict, Any, Iterable, List, Optional
 
-from .simhash import normalize_code, tokenize, compute_simhash
-from .winnowing import winnow
+import numpy as np
+
+from preprocessing.snapshot import RepoLike, SnapshotFile, iter_repo_files, stream_files
+from storage.fingerprint_cache import cacheable
+from .lexer import LEGACY, Vocabulary, get_vocabulary
+from .simhash import simhash_vector_ids, simhash_from_vector
+from .winnowing import (
+    Winnower,
+    kgram_hashes,
+    rolling_kgram_hashes,
+    FINGERPRINT_VERSIONS,
+    WINNOWING_MODE,
+)
+
+logger = logging.getLogger(__name__)
 
 CODE_EXTS = (".py", ".js", ".java", ".ts", ".cpp", ".c", ".hpp", ".h")
-SKIP_DIRS = ("node_modules", ".git", "venv", "__pycache__", "dist", "build")
+
+# ------------------------------------------------------
+# Parallel fingerprinting
+#   FP_WORKERS              processes (0 = cpu count, 1 = serial)
+#   FP_PARALLEL_MIN_BYTES   uncached bytes in a batch below which
+#                           the pool overhead is not worth it
+#   FP_BATCH_FILES          files handed out per batch (bounds memory)
+# ------------------------------------------------------
+FP_WORKERS = int(os.getenv("FP_WORKERS", "0")) or (os.cpu_count() or 1)
+FP_PARALLEL_MIN_BYTES = int(os.getenv("FP_PARALLEL_MIN_BYTES", str(1 << 20)))
+FP_BATCH_FILES = int(os.getenv("FP_BATCH_FILES", "256"))
 
 
 def iter_code_files(repo_path: str):
-    for root, _, files in os.walk(repo_path):
-        if any(skip in root for skip in SKIP_DIRS):
+    yield from iter_repo_files(repo_path, CODE_EXTS)
+
+
+@cacheable
+@dataclass
+class FileFingerprint:
+    """
+    Per-file fingerprint contribution (cacheable by blob hash).
+
+    - simhash_vector: SimHash accumulator, repo vector = sum over files
+    - grams: k-gram hashes fully inside the file
+    - head / tail: first / last k-1 tokens, used to hash the k-grams
+      spanning file boundaries when files are stitched together
+    """
+
+    token_count: int
+    simhash_vector: np.ndarray
+    grams: np.ndarray
+    head: List[str]
+    tail: List[str]
+
+
+def fingerprint_ids(
+    ids: np.ndarray,
+    vocab: Vocabulary,
+    k: int = 15,
+    mode: str = WINNOWING_MODE,
+) -> FileFingerprint:
+    """
+    Fingerprint an interned token stream (uint32 ids of vocab).
+    SimHash and v2 k-grams use the vocabulary's per-id hashes, so
+    no token is hashed twice; v1 (md5) hashes k-gram strings by design.
+    """
+    edge = k - 1
+    id_hashes = vocab.hash_array()
+
+    if mode == "md5":
+        grams = np.array(kgram_hashes(vocab.tokens_of(ids), k, mode), dtype=np.uint64)
+    else:
+        grams = rolling_kgram_hashes(id_hashes[ids], k)
+
+    return FileFingerprint(
+        token_count=len(ids),
+        simhash_vector=simhash_vector_ids(ids, id_hashes),
+        grams=grams,
+        head=vocab.tokens_of(ids[:edge]),
+        tail=vocab.tokens_of(ids[-edge:]) if edge else [],
+    )
+
+
+def fingerprint_text(text: str, k: int = 15, mode: str = WINNOWING_MODE) -> FileFingerprint:
+    vocab = get_vocabulary()
+    return fingerprint_ids(LEGACY.ids(text, vocab), vocab, k, mode)
+
+
+def fingerprint_file(tokens: List[str], k: int = 15, mode: str = WINNOWING_MODE) -> FileFingerprint:
+    vocab = get_vocabulary()
+    return fingerprint_ids(vocab.intern_many(tokens), vocab, k, mode)
+
+
+def _fingerprint_path(path: str, k: int, mode: str) -> FileFingerprint:
+    """Pool task: read, tokenize and hash one file (same text as SnapshotFile)."""
+    try:
+        with open(path, "rb") as fh:
+            text = str(fh.read(), "utf-8", "ignore")
+    except OSError:
+        text = ""
+    return fingerprint_text(text, k, mode)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def _in_daemon_process() -> bool:
+    """
+    True in a process that may not start children. Celery prefork
+    children are billiard processes, which multiprocessing does not
+    always see as daemons, so billiard is asked too when loaded.
+    """
+    if multiprocessing.current_process().daemon:
+        return True
+    billiard = sys.modules.get("billiard.process")
+    return billiard is not None and bool(billiard.current_process().daemon)
+
+
+def get_process_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Shared process pool, None where child processes are not allowed."""
+    global _pool, _pool_workers
+
+    if workers <= 1:
+        return None
+    if _in_daemon_process():
+        # e.g. inside a celery prefork child
+        logger.debug("[FP] No process pool in a daemon process, fingerprinting serially")
+        return None
+
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def discard_process_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool, the next get_process_pool starts a new one."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def cache_namespace(k: int = 15, mode: str = WINNOWING_MODE) -> str:
+    return f"lex-v{FINGERPRINT_VERSIONS[mode]}-k{k}"
+
+
+class RepoFingerprinter:
+    """
+    Assembles a repo-level fingerprint from per-file contributions.
+    Files must be added in snapshot order.
+    """
+
+    def __init__(self, k: int = 15, window: int = 4, mode: str = WINNOWING_MODE):
+        self.winnower = Winnower(k=k, window=window, mode=mode)
+        self.vector = np.zeros(64, dtype=np.int64)
+        self.token_count = 0
+
+    def add(self, fp: FileFingerprint):
+        if not fp.token_count:
+            return
+        self.vector += fp.simhash_vector
+        self.winnower.splice(fp.head, fp.grams, fp.tail)
+        self.token_count += fp.token_count
+
+    def result(self) -> Dict[str, Any]:
+        """winnowing is a sorted uint64 array"""
+        if not self.token_count:
+            return {"simhash": 0, "winnowing": np.empty(0, dtype=np.uint64), "token_count": 0}
+
+        return {
+            "simhash": simhash_from_vector(self.vector),
+            "winnowing": self.winnower.digest_array(),
+            "token_count": self.token_count,
+        }
+
+
+def fingerprint_files(
+    files: Iterable[SnapshotFile],
+    k: int = 15,
+    window: int = 4,
+    mode: str = WINNOWING_MODE,
+    cache=None,
+    release: bool = True,
+    workers: int = FP_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Repo fingerprint from snapshot files, streamed one file at a time.
+
+    The SimHash accumulator and winnowing window state carry across
+    files, so the result equals fingerprinting the concatenated token
+    stream; with release=True each file's text / tokens are dropped
+    once hashed, so peak memory follows the largest file, not the repo.
+    With a cache, only blobs not seen before are tokenized and hashed.
+
+    With workers > 1, files are taken FP_BATCH_FILES at a time and the
+    uncached ones hashed in a process pool when they add up to
+    FP_PARALLEL_MIN_BYTES; per-file results are merged in file order,
+    so the output does not depend on workers.
+    """
+    namespace = cache_namespace(k, mode)
+    repo_fp = RepoFingerprinter(k=k, window=window, mode=mode)
+    pool = get_process_pool(workers)
+
+    def compute(f: SnapshotFile) -> FileFingerprint:
+        # a batched file already closed by stream_files is reopened
+        # here: close it again, or the batch keeps up to FP_BATCH_FILES
+        # files' bytes resident until garbage collection
+        reopened = not f.is_open
+        fp = fingerprint_text(f.text, k, mode)
+        if reopened:
+            f.close()
+        elif release:
+            f.release(("text", "tokens"))
+        return fp
+
+    def store(f: SnapshotFile, fp: FileFingerprint):
+        if cache is not None:
+            cache.put(namespace, f.content_hash, fp)
+
+    # pending batch (pool mode): file order is kept, misses filled in later
+    batch: List[SnapshotFile] = []
+    fps: List[Optional[FileFingerprint]] = []
+    miss_bytes = 0
+
+    def flush():
+        nonlocal pool
+        misses = [i for i, fp in enumerate(fps) if fp is None]
+        computed = None
+        if len(misses) > 1 and miss_bytes >= FP_PARALLEL_MIN_BYTES:
+            try:
+                computed = list(pool.map(
+                    _fingerprint_path,
+                    [batch[i].path for i in misses],
+                    [k] * len(misses),
+                    [mode] * len(misses),
+                ))
+            except (BrokenProcessPool, OSError, AssertionError) as e:
+                # a child died or could not start (OOM killer, fd limit;
+                # multiprocessing asserts in an undetected daemon): this
+                # batch and the rest of the repo are fingerprinted serially
+                logger.warning(f"[FP] Process pool failed, fingerprinting serially: {e}")
+                discard_process_pool(pool)
+                pool = None
+        if computed is None:
+            computed = (compute(batch[i]) for i in misses)
+
+        for i, fp in zip(misses, computed):
+            fps[i] = fp
+            store(batch[i], fp)
+
+        # deterministic merge: always in file order
+        for fp in fps:
+            repo_fp.add(fp)
+
+        batch.clear()
+        fps.clear()
+
+    for f in files:
+        fp = cache.get(namespace, f.content_hash) if cache is not None else None
+
+        if pool is None:
+            if fp is None:
+                fp = compute(f)
+                store(f, fp)
+            repo_fp.add(fp)
             continue
-        for file in files:
-            if file.lower().endswith(CODE_EXTS):
-                yield os.path.join(root, file)
+
+        batch.append(f)
+        fps.append(fp)
+        if fp is None:
+            miss_bytes += f.size
+        if len(batch) >= FP_BATCH_FILES:
+            flush()
+            miss_bytes = 0
+
+    if batch:
+        flush()
+
+    return repo_fp.result()
 
 
 def compute_fingerprints_for_repo(
-    repo_path: str,
+    repo: RepoLike,
     k: int = 15,
-    window: int = 4
+    window: int = 4,
+    cache=None,
 ) -> Dict[str, Any]:
     """
     Compute repo-level fingerprints (DB ingestion).
@@ -29,41 +303,21 @@ def compute_fingerprints_for_repo(
     Returns:
     {
         "repo_simhash": int,
-        "winnowing": Set[int],
+        "winnowing": np.ndarray (sorted uint64),
         "total_tokens": int
     }
     """
 
-    all_tokens: List[str] = []
-
-    for file_path in iter_code_files(repo_path):
-        try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                code = f.read()
-        except Exception:
-            continue
-
-        if not code.strip():
-            continue
-
-        normalized = normalize_code(code)
-        tokens = tokenize(normalized)
-
-        if tokens:
-            all_tokens.extend(tokens)
-
-    if not all_tokens:
-        return {
-            "repo_simhash": 0,
-            "winnowing": set(),
-            "total_tokens": 0,
-        }
-
-    repo_simhash = compute_simhash(all_tokens)
-    repo_winnowing = winnow(all_tokens, k=k, window=window)
+    fp = fingerprint_files(
+        stream_files(repo, CODE_EXTS),
+        k=k,
+        window=window,
+        mode="md5",
+        cache=cache,
+    )
 
     return {
-        "repo_simhash": repo_simhash,
-        "winnowing": repo_winnowing,
-        "total_tokens": len(all_tokens),
+        "repo_simhash": fp["simhash"],
+        "winnowing": fp["winnowing"],
+        "total_tokens": fp["token_count"],
     }
@@ -1,38 +1,93 @@
+import importlib
+import importlib.util
+import logging
+import threading
+from typing import FrozenSet, Optional
+
 from tree_sitter import Parser, Language
-import tree_sitter_python as tspython
-import tree_sitter_java as tsjava
-import tree_sitter_javascript as tsjs
-# pip install tree-sitter-typescript
-import tree_sitter_typescript as tsts 
 
-# Map keys to the actual grammar functions
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------
+# Grammar registry
+# language key (parsing.language_detector) -> (package, function)
+#
+# Grammar packages are imported on first use, so a worker only loads
+# the languages it parses. C and C++ are optional extras:
+#   pip install tree-sitter-c tree-sitter-cpp
 # Note: typescript and tsx are different grammars within the same package
-LANGUAGE_FUNCTIONS = {
-    "python": tspython.language,
-    "java": tsjava.language,
-    "javascript": tsjs.language,
-    "typescript": tsts.language_typescript,
-    "tsx": tsts.language_tsx,
+# ------------------------------------------------------
+GRAMMARS = {
+    "python": ("tree_sitter_python", "language"),
+    "java": ("tree_sitter_java", "language"),
+    "javascript": ("tree_sitter_javascript", "language"),
+    "typescript": ("tree_sitter_typescript", "language_typescript"),
+    "tsx": ("tree_sitter_typescript", "language_tsx"),
+    "c": ("tree_sitter_c", "language"),
+    "cpp": ("tree_sitter_cpp", "language"),
 }
 
-_PARSER_CACHE = {}
+# Language objects are immutable and shared (None: grammar unusable);
+# a Parser is not thread-safe, so every thread gets its own (kept for
+# its lifetime)
+_LANGUAGE_CACHE = {}
+_language_lock = threading.Lock()
+_available: Optional[FrozenSet[str]] = None
+_local = threading.local()
+
 
 class TreeSitterParser:
+    @staticmethod
+    def available_languages() -> FrozenSet[str]:
+        """
+        Languages whose grammar package is installed, found without
+        importing it (callers filter files before reading them).
+        """
+        global _available
+        if _available is None:
+            _available = frozenset(
+                lang for lang, (module, _) in GRAMMARS.items()
+                if importlib.util.find_spec(module) is not None
+            )
+        return _available
+
+    @staticmethod
+    def _get_language(lang: str):
+        if lang in _LANGUAGE_CACHE:
+            return _LANGUAGE_CACHE[lang]
+
+        if lang not in TreeSitterParser.available_languages():
+            return None
+
+        with _language_lock:
+            if lang not in _LANGUAGE_CACHE:
+                module, function = GRAMMARS[lang]
+                try:
+                    # Wrap the capsule in a Language object
+                    # This fixes the "Incompatible Language version" and "PyCapsule" errors
+                    lang_func = getattr(importlib.import_module(module), function)
+                    _LANGUAGE_CACHE[lang] = Language(lang_func())
+                except Exception as e:
+                    logger.warning(f"[PARSER] Grammar {module} unusable for {lang}: {e}")
+                    _LANGUAGE_CACHE[lang] = None
+            return _LANGUAGE_CACHE[lang]
+
     @staticmethod
     def _get_parser(lang: str):
-        if lang in _PARSER_CACHE:
-            return _PARSER_CACHE[lang]
+        """Parser for lang owned by the calling thread."""
+        parsers = getattr(_local, "parsers", None)
+        if parsers is None:
+            parsers = _local.parsers = {}
+
+        if lang in parsers:
+            return parsers[lang]
 
-        if lang not in LANGUAGE_FUNCTIONS:
+        language_object = TreeSitterParser._get_language(lang)
+        if language_object is None:
             return None
 
-        # Wrap the capsule in a Language object
-        # This fixes the "Incompatible Language version" and "PyCapsule" errors
-        lang_func = LANGUAGE_FUNCTIONS[lang]
-        language_object = Language(lang_func())
-        
         parser = Parser(language_object)
-        _PARSER_CACHE[lang] = parser
+        parsers[lang] = parser
         return parser
 
     @staticmethod
@@ -40,4 +95,4 @@ class TreeSitterParser:
         parser = TreeSitterParser._get_parser(lang)
         if not parser or not code:
             return None
-        return parser.parse(code.encode("utf8"))
\ No newline at end of file
+        return parser.parse(code.encode("utf8"))
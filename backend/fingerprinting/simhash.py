@@ -2,6 +2,12 @@
 import re
 import hashlib
 from collections import Counter
+from typing import Iterable
+
+import numpy as np
+
+# bit positions 0..63, used to expand token hashes into sign matrices
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
 
 def normalize_code(text: str) -> str:
     """
@@ -25,9 +31,78 @@ def tokenize(text: str):
     return re.findall(r"[A-Za-z_]\w*|\d+", text)
 
 
+def token_hashes(tokens: Iterable[str]) -> np.ndarray:
+    """
+    Hash tokens into a uint64 array in one pass.
+
+    Each value is the low 64 bits of the token's md5 digest, i.e. exactly the
+    bits the original per-token loop consumed.
+    """
+    digests = b"".join(hashlib.md5(t.encode()).digest()[8:] for t in tokens)
+    return np.frombuffer(digests, dtype=">u8").astype(np.uint64)
+
+
+def simhash_vector(tokens) -> np.ndarray:
+    """
+    Weighted SimHash accumulator (one signed int64 counter per bit).
+
+    Vectors are additive: the vector of a concatenation equals the sum of
+    the vectors of its parts.
+    """
+    token_freq = Counter(tokens)
+    if not token_freq:
+        return np.zeros(64, dtype=np.int64)
+
+    hashes = token_hashes(token_freq.keys())
+    weights = np.fromiter(token_freq.values(), dtype=np.int64, count=len(token_freq))
+
+    return _weighted_vector(hashes, weights)
+
+
+def simhash_vector_ids(ids: np.ndarray, id_hashes: np.ndarray) -> np.ndarray:
+    """
+    simhash_vector for an interned token stream: id_hashes[i] is the
+    precomputed hash of token id i, so no token is hashed again.
+    """
+    if not len(ids):
+        return np.zeros(64, dtype=np.int64)
+
+    unique_ids, counts = np.unique(ids, return_counts=True)
+    return _weighted_vector(id_hashes[unique_ids], counts.astype(np.int64))
+
+
+def _weighted_vector(hashes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # (tokens x 64) matrix of +1 / -1
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    signs = bits.astype(np.int64) * 2 - 1
+
+    return weights @ signs
+
+
+def simhash_from_vector(v: np.ndarray) -> int:
+    """
+    Collapse an accumulator vector into the final fingerprint.
+    """
+    fingerprint = 0
+    for i in np.flatnonzero(v > 0):
+        fingerprint |= (1 << int(i))
+    return fingerprint
+
+
 def compute_simhash(tokens, hash_bits: int = 64) -> int:
     """
-    Compute weighted SimHash.
+    Compute weighted SimHash (vectorized).
+    """
+    if hash_bits != 64:
+        return _compute_simhash_py(tokens, hash_bits)
+
+    return simhash_from_vector(simhash_vector(tokens))
+
+
+def _compute_simhash_py(tokens, hash_bits: int = 64) -> int:
+    """
+    Reference pure-Python implementation.
+    Kept for hash_bits != 64 and for benchmarking.
     """
     v = [0] * hash_bits
     token_freq = Counter(tokens)
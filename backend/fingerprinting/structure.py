@@ -0,0 +1,288 @@
+# fingerprinting/structure.py
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .lsh import MinHasher, band_matrix, bucket_pairs
+from .simhash import token_hashes
+from .winnowing import _mix64, intersection_size
+
+# ------------------------------------------------------
+# Structural signatures
+#
+# A file's signature is (node-type bigram hashes, node-type hashes),
+# both sorted unique uint64 arrays: computed in one traversal, cached
+# by blob hash, and compared as sets. For many files at once the sets
+# become rows of sparse 0/1 matrices, so all pairwise intersections of
+# a language come from one sparse product (in row blocks).
+# ------------------------------------------------------
+STRUCT_BLOCK_ROWS = int(os.getenv("STRUCT_BLOCK_ROWS", "512"))
+
+# ------------------------------------------------------
+# File-pair LSH (MinHash over the same shingles)
+#
+# A pair with Jaccard s is proposed with probability
+# 1 - (1 - s^ROWS)^BANDS; with 20 x 6:
+#   s=0.5 -> ~0.27, s=0.7 -> ~0.92, s=0.8 -> ~0.998
+# Node-type bigrams are common to most files of a language (0.3-0.5
+# between unrelated files), so the threshold is set high.
+# More bands / fewer rows: more recall, fewer pairs pruned.
+# Languages with fewer than STRUCT_LSH_MIN_PAIRS pairs are scored
+# exhaustively (0 disables LSH).
+# ------------------------------------------------------
+STRUCT_LSH_BANDS = int(os.getenv("STRUCT_LSH_BANDS", "20"))
+STRUCT_LSH_ROWS = int(os.getenv("STRUCT_LSH_ROWS", "6"))
+STRUCT_LSH_MIN_PAIRS = int(os.getenv("STRUCT_LSH_MIN_PAIRS", "1000000"))
+
+# odd 64-bit multiplier combining the two type hashes of a bigram
+_PAIR_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+Signature = Tuple[np.ndarray, np.ndarray]
+
+_type_hashes: Dict[str, int] = {}
+
+
+def node_type_hashes(types: Sequence[str]) -> np.ndarray:
+    """64-bit hash of each node type (md5 low bits, memoized per type)."""
+    new = [t for t in set(types) if t not in _type_hashes]
+    if new:
+        _type_hashes.update(zip(new, token_hashes(new).tolist()))
+    return np.fromiter((_type_hashes[t] for t in types), dtype=np.uint64, count=len(types))
+
+
+def named_node_spans(root_node, span_types=frozenset()) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Types of the named nodes of a tree, in pre-order, and the
+    [start, end) range of that list covered by each node whose type is
+    in span_types (its subtree), in order of the nodes' end.
+    """
+    types = []
+    spans = []
+    open_spans = []   # (start, depth) of the span nodes above the cursor
+    cursor = root_node.walk()
+    depth = 0
+    while True:
+        node = cursor.node
+        if node.type in span_types:
+            open_spans.append((len(types), depth))
+        if node.is_named:
+            types.append(node.type)
+
+        if cursor.goto_first_child():
+            depth += 1
+            continue
+        while True:
+            # leaving the node under the cursor
+            if open_spans and open_spans[-1][1] == depth:
+                spans.append((open_spans.pop()[0], len(types)))
+            if depth == 0:
+                return types, spans
+            if cursor.goto_next_sibling():
+                break
+            cursor.goto_parent()
+            depth -= 1
+
+
+def named_node_types(root_node) -> List[str]:
+    """Types of the named nodes of a tree, in pre-order."""
+    return named_node_spans(root_node)[0]
+
+
+def type_bigrams(hashes: np.ndarray) -> np.ndarray:
+    """Hash of each consecutive pair of a pre-order node_type_hashes array."""
+    return _mix64(hashes[:-1] * _PAIR_MULT + hashes[1:])
+
+
+def type_signature(hashes: np.ndarray) -> Signature:
+    """(bigram hashes, type hashes) of a pre-order node_type_hashes array."""
+    return np.unique(type_bigrams(hashes)), np.unique(hashes)
+
+
+def tree_signature(root_node) -> Signature:
+    """(bigram hashes, type hashes) of consecutive named nodes in pre-order."""
+    return type_signature(node_type_hashes(named_node_types(root_node)))
+
+
+def signature_jaccard(sig1: Signature, sig2: Signature) -> float:
+    """
+    Structural Jaccard of two signatures: over bigrams, or over node
+    types when either file has no bigram; 0 when either has no node.
+    """
+    set1, types1 = sig1
+    set2, types2 = sig2
+
+    if not len(types1) or not len(types2):
+        return 0.0
+
+    if not len(set1) or not len(set2):
+        set1, set2 = types1, types2
+
+    intersection = intersection_size(set1, set2)
+    union = len(set1) + len(set2) - intersection
+    return float(intersection) / union if union > 0 else 0.0
+
+
+# ------------------------------------------------------
+# Matrix form
+# ------------------------------------------------------
+def _incidence(left: List[np.ndarray], right: List[np.ndarray]):
+    """0/1 CSR matrices (rows = sets) over the columns both sides use."""
+    sizes = np.array([len(s) for s in left + right], dtype=np.int64)
+    values = np.concatenate(left + right) if len(sizes) else np.empty(0, dtype=np.uint64)
+    _, columns = np.unique(values, return_inverse=True)
+    n_columns = int(columns.max()) + 1 if len(columns) else 0
+
+    indptr = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=indptr[1:])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(columns), dtype=np.int32), columns.ravel(), indptr),
+        shape=(len(sizes), n_columns),
+    )
+    return matrix[: len(left)], matrix[len(left) :], sizes[: len(left)], sizes[len(left) :]
+
+
+def _set_jaccard_blocks(left: List[np.ndarray], right: List[np.ndarray], block_rows: int):
+    """Yield (first row, dense Jaccard block) of all left x right pairs."""
+    a, b, a_sizes, b_sizes = _incidence(left, right)
+    bt = b.T.tocsc()
+
+    for start in range(0, len(left), block_rows):
+        stop = min(start + block_rows, len(left))
+        inter = (a[start:stop] @ bt).toarray()
+        union = a_sizes[start:stop, None] + b_sizes[None, :] - inter
+        yield start, np.divide(inter, union, out=np.zeros(inter.shape), where=union > 0)
+
+
+def jaccard_blocks(
+    left: List[Signature],
+    right: List[Signature],
+    block_rows: int = STRUCT_BLOCK_ROWS,
+):
+    """
+    signature_jaccard of every left x right pair, as dense
+    (first row, block) chunks of at most block_rows rows.
+    """
+    if not left or not right:
+        return
+
+    left_bigrams = [s[0] for s in left]
+    right_bigrams = [s[0] for s in right]
+
+    # pairs where a side has no bigram fall back to node types
+    left_types = np.array([len(s[1]) > 0 for s in left])
+    right_types = np.array([len(s[1]) > 0 for s in right])
+    left_fallback = np.flatnonzero(np.array([not len(s[0]) for s in left]))
+    right_fallback = np.flatnonzero(np.array([not len(s[0]) for s in right]))
+
+    type_rows = type_cols = None
+    if len(left_fallback):
+        type_rows = next(_set_jaccard_blocks([left[i][1] for i in left_fallback], [s[1] for s in right], len(left)))[1]
+    if len(right_fallback):
+        type_cols = next(_set_jaccard_blocks([s[1] for s in left], [right[j][1] for j in right_fallback], len(left)))[1]
+
+    for start, block in _set_jaccard_blocks(left_bigrams, right_bigrams, block_rows):
+        stop = start + len(block)
+        if type_cols is not None:
+            block[:, right_fallback] = type_cols[start:stop]
+        if type_rows is not None:
+            rows = (left_fallback >= start) & (left_fallback < stop)
+            block[left_fallback[rows] - start] = type_rows[rows]
+        block[~left_types[start:stop]] = 0.0
+        block[:, ~right_types] = 0.0
+        yield start, block
+
+
+def max_jaccard(left: List[Signature], right: List[Signature], block_rows: int = STRUCT_BLOCK_ROWS) -> float:
+    """Best signature_jaccard over all left x right pairs (0 if none)."""
+    best = 0.0
+    for _, block in jaccard_blocks(left, right, block_rows):
+        if block.size:
+            best = max(best, float(block.max()))
+    return best
+
+
+def pair_jaccard(
+    left: List[Signature],
+    right: List[Signature],
+    i: np.ndarray,
+    j: np.ndarray,
+    block_rows: int = STRUCT_BLOCK_ROWS,
+) -> np.ndarray:
+    """
+    signature_jaccard of the pairs (left[i[k]], right[j[k]]), i sorted.
+    Per block of left rows, only the right rows paired with it enter
+    the sparse product.
+    """
+    scores = np.zeros(len(i))
+    if not len(i):
+        return scores
+
+    a, b, a_sizes, b_sizes = _incidence([s[0] for s in left], [s[0] for s in right])
+    bounds = np.searchsorted(i, np.arange(0, len(left) + block_rows, block_rows))
+
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if lo == hi:
+            continue
+        ii, jj = i[lo:hi], j[lo:hi]
+        rows, row_of = np.unique(ii, return_inverse=True)
+        cols, col_of = np.unique(jj, return_inverse=True)
+
+        inter = (a[rows] @ b[cols].T).toarray()[row_of.ravel(), col_of.ravel()]
+        union = a_sizes[ii] + b_sizes[jj] - inter
+        scores[lo:hi] = np.divide(inter, union, out=np.zeros(len(ii)), where=union > 0)
+
+    # pairs without bigrams on a side, or without nodes: exact per pair
+    odd = np.flatnonzero(
+        (a_sizes[i] == 0) | (b_sizes[j] == 0)
+        | np.array([not len(left[k][1]) for k in i])
+        | np.array([not len(right[k][1]) for k in j])
+    )
+    for k in odd:
+        scores[k] = signature_jaccard(left[i[k]], right[j[k]])
+    return scores
+
+
+_minhashers: Dict[int, MinHasher] = {}
+
+
+def candidate_pairs(
+    left: List[Signature],
+    right: List[Signature],
+    bands: int = STRUCT_LSH_BANDS,
+    rows: int = STRUCT_LSH_ROWS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (i, j) pairs of likely similar files, by MinHash LSH over the
+    bigram shingles (node types for files without bigrams).
+    """
+    num_perm = bands * rows
+    if num_perm not in _minhashers:
+        _minhashers[num_perm] = MinHasher(num_perm=num_perm)
+    hasher = _minhashers[num_perm]
+
+    def keys(sigs):
+        return band_matrix(hasher.signatures([s[0] if len(s[0]) else s[1] for s in sigs]), bands, rows)
+
+    return bucket_pairs(keys(left), keys(right))
+
+
+def best_match(
+    left: List[Signature],
+    right: List[Signature],
+    min_lsh_pairs: int = STRUCT_LSH_MIN_PAIRS,
+) -> Tuple[float, int]:
+    """
+    (best signature_jaccard, pairs scored) over left x right: all pairs
+    when there are few, else only the pairs proposed by candidate_pairs.
+    """
+    n_pairs = len(left) * len(right)
+    if not n_pairs:
+        return 0.0, 0
+    if not min_lsh_pairs or n_pairs < min_lsh_pairs:
+        return max_jaccard(left, right), n_pairs
+
+    i, j = candidate_pairs(left, right)
+    scores = pair_jaccard(left, right, i, j)
+    return (float(scores.max()) if len(scores) else 0.0), len(i)
@@ -1,8 +1,20 @@
+import numpy as np
+
+# trees with fewer UAST nodes than this are scored down proportionally
+MIN_UAST_SIZE = 15.0
+
+
 class UASTScorer:
     @staticmethod
     def normalize(raw_score: float, size: int) -> float:
         if size <= 0:
             return 0.0
 
-        factor = min(1.0, size / 15.0)
+        factor = min(1.0, size / MIN_UAST_SIZE)
         return round(raw_score * factor, 4)
+
+    @staticmethod
+    def normalize_many(raw_scores: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """normalize() over arrays (unrounded)."""
+        factor = np.clip(np.asarray(sizes, dtype=np.float64) / MIN_UAST_SIZE, 0.0, 1.0)
+        return raw_scores * factor
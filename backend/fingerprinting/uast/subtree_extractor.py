@@ -1,5 +1,30 @@
-from typing import List
-from fingerprinting.uast.uast_nodes import UASTNode
+from typing import Dict, List, Union
+from fingerprinting.simhash import token_hashes
+from fingerprinting.uast.uast_nodes import UAST_TYPES, FlatUAST, UASTNode, UASTNodeType, UASTView
+
+MASK64 = (1 << 64) - 1
+_MULT = 0x9E3779B97F4A7C15
+
+# 64-bit hash of every node type (low 64 bits of md5 of its value)
+_TYPE_HASHES: Dict[UASTNodeType, int] = dict(
+    zip(UASTNodeType, token_hashes(t.value for t in UASTNodeType).tolist())
+)
+
+
+def _mix(z: int) -> int:
+    """splitmix64 finalizer on a Python int."""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def merkle_hash(type_hash: int, child_hashes: List[int]) -> int:
+    """Hash of a subtree from its node type and its children's hashes, in order."""
+    h = type_hash
+    for c in child_hashes:
+        h = _mix((h * _MULT + c) & MASK64)
+    return h
+
 
 class SubtreeExtractor:
     @staticmethod
@@ -8,6 +33,57 @@ class SubtreeExtractor:
         SubtreeExtractor._dfs(root, acc)
         return acc
 
+    @staticmethod
+    def hashes(root: Union[UASTNode, UASTView, FlatUAST]) -> List[int]:
+        """
+        64-bit Merkle hash of every subtree, in post-order: equal for
+        equal subtrees, i.e. for equal _serialize strings (up to 64-bit
+        collisions). One iterative pass, linear in the tree size.
+        """
+        if isinstance(root, UASTView) and root.index == 0:
+            root = root.flat
+        if isinstance(root, FlatUAST):
+            return SubtreeExtractor._flat_hashes(root)
+
+        out: List[int] = []
+        values: List[int] = []   # hashes of finished subtrees, in order
+        stack = [(root, False)]
+
+        while stack:
+            node, done = stack.pop()
+            if not done:
+                stack.append((node, True))
+                stack.extend((c, False) for c in reversed(node.children))
+                continue
+
+            n = len(node.children)
+            children = values[len(values) - n :] if n else []
+            if n:
+                del values[-n:]
+            h = merkle_hash(_TYPE_HASHES[node.node_type], children)
+            values.append(h)
+            out.append(h)
+
+        return out
+
+    @staticmethod
+    def _flat_hashes(flat: FlatUAST) -> List[int]:
+        """hashes() over the arrays: reverse pre-order visits children first."""
+        type_hashes = [_TYPE_HASHES[t] for t in UAST_TYPES]
+        types = flat.types.tolist()
+        first_child = flat.first_child.tolist()
+        next_sibling = flat.next_sibling.tolist()
+
+        h = [0] * len(types)
+        for i in range(len(types) - 1, -1, -1):
+            v = type_hashes[types[i]]
+            c = first_child[i]
+            while c >= 0:
+                v = _mix((v * _MULT + h[c]) & MASK64)
+                c = next_sibling[c]
+            h[i] = v
+        return h
+
     @staticmethod
     def _dfs(node: UASTNode, acc: List[str]):
         acc.append(SubtreeExtractor._serialize(node))
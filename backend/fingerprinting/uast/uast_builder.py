@@ -1,4 +1,4 @@
-from fingerprinting.uast.uast_nodes import UASTNode, UASTNodeType
+from fingerprinting.uast.uast_nodes import TYPE_CODES, FlatUAST, UASTNode, UASTNodeType
 
 # ------------------------------------------------------
 # Tree-sitter → UAST normalization map
@@ -9,14 +9,18 @@ NODE_MAP = {
     # Python / Java / C-like languages
     # ==================================================
     "class_definition": UASTNodeType.CLASS,
+    "class_declaration": UASTNodeType.CLASS,
     "function_definition": UASTNodeType.FUNCTION,
     "method_definition": UASTNodeType.FUNCTION,
+    "method_declaration": UASTNodeType.FUNCTION,
+    "class_specifier": UASTNodeType.CLASS,   # C++
 
     # ==================================================
     # JavaScript / TypeScript functions
     # ==================================================
     "function_declaration": UASTNodeType.FUNCTION,
     "arrow_function": UASTNodeType.FUNCTION,
+    "function_expression": UASTNodeType.FUNCTION,
 
     # ==================================================
     # Control flow
@@ -24,10 +28,13 @@ NODE_MAP = {
     "for_statement": UASTNodeType.LOOP,
     "while_statement": UASTNodeType.LOOP,
     "do_statement": UASTNodeType.LOOP,
+    "enhanced_for_statement": UASTNodeType.LOOP,
+    "for_range_loop": UASTNodeType.LOOP,   # C++
     "for_in_statement": UASTNodeType.LOOP,
     "for_of_statement": UASTNodeType.LOOP,
 
     "if_statement": UASTNodeType.BRANCH,
+    "elif_clause": UASTNodeType.BRANCH,   # Python, nested like else-if
     "switch_statement": UASTNodeType.MULTI_BRANCH,
     "conditional_expression": UASTNodeType.BRANCH,
 
@@ -36,6 +43,7 @@ NODE_MAP = {
     # ==================================================
     "call_expression": UASTNodeType.CALL,
     "method_invocation": UASTNodeType.CALL,
+    "call": UASTNodeType.CALL,
 
     # JSX → treat component usage as CALL
     "jsx_element": UASTNodeType.CALL,
@@ -45,52 +53,91 @@ NODE_MAP = {
     # Assignments & returns
     # ==================================================
     "assignment_expression": UASTNodeType.ASSIGN,
+    "augmented_assignment_expression": UASTNodeType.ASSIGN,
+    "assignment": UASTNodeType.ASSIGN,
+    "augmented_assignment": UASTNodeType.ASSIGN,
+    # declarations with an initializer are Python's plain assignments
+    "variable_declarator": UASTNodeType.ASSIGN,   # JS / TS / Java
+    "init_declarator": UASTNodeType.ASSIGN,       # C / C++
     "return_statement": UASTNodeType.RETURN,
 }
 
 
+# tree-sitter type -> FlatUAST type code
+_CODE_MAP = {ts_type: TYPE_CODES[t] for ts_type, t in NODE_MAP.items()}
+
+
 class UASTBuilder:
     """
     Builds a Universal AST (UAST) from Tree-sitter AST.
 
     - Language-agnostic
     - Depth-limited
-    - Safe for large frontend repos
+    - Safe for large frontend repos: built iteratively with a
+      TreeCursor into flat arrays (FlatUAST)
     """
 
     MAX_DEPTH = 20
 
     @staticmethod
-    def build(tree):
+    def build(tree) -> UASTNode:
         """
         Entry point to build UAST from tree-sitter AST.
+        Object form of build_flat().
         """
-        root = UASTNode(UASTNodeType.ENTRY)
-        if not tree or not tree.root_node:
-            return root
-
-        UASTBuilder._walk(tree.root_node, root, 0)
-        return root
+        return UASTBuilder.build_flat(tree).to_tree()
 
     @staticmethod
-    def _walk(ast_node, parent: UASTNode, depth: int):
+    def build_flat(tree) -> FlatUAST:
         """
-        Recursive DFS traversal of tree-sitter AST,
-        mapping known node types into UAST nodes.
+        Pre-order cursor walk of the tree-sitter AST (nodes deeper than
+        MAX_DEPTH are skipped with their subtrees), mapping known node
+        types into UAST nodes; unmapped nodes pass their children on
+        to the nearest mapped ancestor.
         """
+        types = [TYPE_CODES[UASTNodeType.ENTRY]]
+        parent, depth = [-1], [0]
+        first_child, next_sibling, last_child = [-1], [-1], [-1]
 
-        if ast_node is None or depth > UASTBuilder.MAX_DEPTH:
-            return
-
-        node_type = NODE_MAP.get(ast_node.type)
-        current_parent = parent
-
-        # If this AST node maps to a UAST node, create it
-        if node_type:
-            u_node = UASTNode(node_type)
-            parent.add_child(u_node)
-            current_parent = u_node
-
-        # Continue traversal
-        for child in ast_node.children:
-            UASTBuilder._walk(child, current_parent, depth + 1)
+        if not tree or not tree.root_node:
+            return FlatUAST(types, parent, first_child, next_sibling, depth)
+
+        code_map = _CODE_MAP
+        max_depth = UASTBuilder.MAX_DEPTH
+
+        # mapped ancestors of the cursor: (tree-sitter depth, UAST index)
+        ancestors = [(-1, 0)]
+        cursor = tree.walk()
+        ts_depth = 0
+
+        while True:
+            code = code_map.get(cursor.node.type)
+            if code is not None:
+                p = ancestors[-1][1]
+                index = len(types)
+                types.append(code)
+                parent.append(p)
+                depth.append(depth[p] + 1)
+                first_child.append(-1)
+                next_sibling.append(-1)
+                last_child.append(-1)
+                if last_child[p] < 0:
+                    first_child[p] = index
+                else:
+                    next_sibling[last_child[p]] = index
+                last_child[p] = index
+                ancestors.append((ts_depth, index))
+
+            if ts_depth < max_depth and cursor.goto_first_child():
+                ts_depth += 1
+                continue
+
+            # leave finished nodes until one has a next sibling
+            while True:
+                if ancestors[-1][0] == ts_depth:
+                    ancestors.pop()
+                if cursor.goto_next_sibling():
+                    break
+                if not cursor.goto_parent():
+                    return FlatUAST(types, parent, first_child, next_sibling, depth)
+                ts_depth -= 1
@@ -3,8 +3,10 @@ from fingerprinting.uast.subtree_extractor import SubtreeExtractor
 class UASTComparator:
     @staticmethod
     def similarity(tree_a, tree_b) -> float:
-        subs_a = set(SubtreeExtractor.extract(tree_a))
-        subs_b = set(SubtreeExtractor.extract(tree_b))
+        # subtrees as 64-bit Merkle hashes (same sets as the
+        # serialized strings of SubtreeExtractor.extract)
+        subs_a = set(SubtreeExtractor.hashes(tree_a))
+        subs_b = set(SubtreeExtractor.hashes(tree_b))
 
         if not subs_a or not subs_b:
             return 0.0
@@ -0,0 +1,92 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from fingerprinting.utils import shared_counts
+from fingerprinting.uast.score import UASTScorer
+from fingerprinting.uast.subtree_extractor import SubtreeExtractor
+from fingerprinting.uast.uast_builder import UASTBuilder
+from fingerprinting.uast.uast_nodes import FlatUAST
+
+# subtrees lower than this are not compared: leaves (a lone CALL or
+# ASSIGN) are in every file of every language. Over stdlib Python x
+# unrelated JavaScript files, dropping them takes the best pair score
+# from ~0.47 to ~0.08.
+UAST_MIN_HEIGHT = 1
+
+# (sorted unique subtree hashes, their sizes in nodes, number of
+# mapped UAST nodes)
+UASTEntry = Tuple[np.ndarray, np.ndarray, int]
+
+
+def subtree_shapes(flat: FlatUAST) -> Tuple[np.ndarray, np.ndarray]:
+    """(size, height) of the subtree under every node, leaves 1 / 0."""
+    size = np.ones(len(flat), dtype=np.int64)
+    height = np.zeros(len(flat), dtype=np.int64)
+    # deepest level first, so every child is final before its parent
+    for depth in range(int(flat.depth.max()), 0, -1):
+        nodes = np.flatnonzero(flat.depth == depth)
+        parents = flat.parent[nodes]
+        np.add.at(size, parents, size[nodes])
+        np.maximum.at(height, parents, height[nodes] + 1)
+    return size, height
+
+
+def uast_entry(tree) -> Optional[UASTEntry]:
+    """
+    Weighted subtree-hash set of a tree-sitter tree's UAST: every
+    subtree of height >= UAST_MIN_HEIGHT below the root, weighted by
+    its size. None when no node maps to the UAST.
+    """
+    flat = UASTBuilder.build_flat(tree)
+    if len(flat) <= 1:
+        return None
+
+    hashes = np.array(SubtreeExtractor.hashes(flat), dtype=np.uint64)
+    size, height = subtree_shapes(flat)
+    keep = height >= UAST_MIN_HEIGHT
+    keep[0] = False   # the ENTRY root, i.e. the whole file
+
+    # equal hashes are equal subtrees, of equal size
+    hashes, first = np.unique(hashes[keep], return_index=True)
+    return hashes, size[keep][first], len(flat) - 1
+
+
+class SubtreeIndex:
+    """
+    Inverted index subtree hash -> files of one repo.
+
+    All files' hash sets are concatenated and sorted once, with the
+    owning file and the subtree size; the intersections of a query
+    file with every indexed file then come from one searchsorted pass
+    over its hashes.
+    """
+
+    def __init__(self, entries: Sequence[UASTEntry], groups: Sequence[str]):
+        self.groups = np.array(groups, dtype=object)
+        self.sizes = np.array([e[2] for e in entries], dtype=np.int64)
+        self.weights = np.array([e[1].sum() for e in entries], dtype=np.float64)
+
+        n_hashes = [len(e[0]) for e in entries]
+        hashes = np.concatenate([e[0] for e in entries]) if entries else np.empty(0, dtype=np.uint64)
+        weights = np.concatenate([e[1] for e in entries]) if entries else np.empty(0, dtype=np.int64)
+        owners = np.repeat(np.arange(len(entries), dtype=np.int32), n_hashes)
+        order = np.argsort(hashes, kind="stable")
+        self.post_hashes = hashes[order]
+        self.post_owners = owners[order]
+        self.post_weights = weights[order].astype(np.float64)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def scores(self, entry: UASTEntry) -> np.ndarray:
+        """
+        Size-weighted Jaccard of the subtree sets with every indexed
+        file (shared nodes / nodes in either), scaled like
+        UASTScorer.normalize by the smaller of the two UAST sizes.
+        """
+        hashes, weights, size = entry
+        inter = shared_counts(self.post_hashes, self.post_owners, len(self), hashes, self.post_weights)
+        union = float(weights.sum()) + self.weights - inter
+        raw = np.divide(inter, union, out=np.zeros(len(self)), where=union > 0)
+        return UASTScorer.normalize_many(raw, np.minimum(self.sizes, size))
@@ -2,6 +2,8 @@ from enum import Enum
 from dataclasses import dataclass, field
 from typing import List
 
+import numpy as np
+
 
 class UASTNodeType(Enum):
     """
@@ -64,3 +66,113 @@ class UASTNode:
 
     def __repr__(self):
         return f"{self.node_type.value}(d={self.depth}, c={len(self.children)})"
+
+
+# ------------------------------------------------------
+# Array-backed UAST
+# ------------------------------------------------------
+UAST_TYPES: List[UASTNodeType] = list(UASTNodeType)
+TYPE_CODES = {t: code for code, t in enumerate(UAST_TYPES)}
+
+
+class FlatUAST:
+    """
+    UAST as parallel arrays (one entry per node):
+
+    - types: node type code (index into UAST_TYPES)
+    - parent, first_child, next_sibling: node indices, -1 for none
+    - depth: UAST depth (root = 0)
+
+    Node 0 is the ENTRY root and nodes are stored in pre-order,
+    so every child comes after its parent.
+    """
+
+    __slots__ = ("types", "parent", "first_child", "next_sibling", "depth")
+
+    def __init__(self, types, parent, first_child, next_sibling, depth):
+        self.types = np.asarray(types, dtype=np.uint8)
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.first_child = np.asarray(first_child, dtype=np.int32)
+        self.next_sibling = np.asarray(next_sibling, dtype=np.int32)
+        self.depth = np.asarray(depth, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.types)
+
+    def node_type(self, index: int) -> UASTNodeType:
+        return UAST_TYPES[self.types[index]]
+
+    def children(self, index: int) -> List[int]:
+        out = []
+        child = int(self.first_child[index])
+        while child >= 0:
+            out.append(child)
+            child = int(self.next_sibling[child])
+        return out
+
+    @property
+    def root(self) -> "UASTView":
+        """UASTNode-compatible view of the root."""
+        return UASTView(self, 0)
+
+    @classmethod
+    def from_tree(cls, root: UASTNode) -> "FlatUAST":
+        types, parent, depth = [], [], []
+        first_child, next_sibling = [], []
+        last_child: List[int] = []
+
+        stack = [(root, -1)]
+        while stack:
+            node, p = stack.pop()
+            index = len(types)
+            types.append(TYPE_CODES[node.node_type])
+            parent.append(p)
+            depth.append(depth[p] + 1 if p >= 0 else 0)
+            first_child.append(-1)
+            next_sibling.append(-1)
+            last_child.append(-1)
+            if p >= 0:
+                if last_child[p] < 0:
+                    first_child[p] = index
+                else:
+                    next_sibling[last_child[p]] = index
+                last_child[p] = index
+            stack.extend((c, index) for c in reversed(node.children))
+
+        return cls(types, parent, first_child, next_sibling, depth)
+
+    def to_tree(self) -> UASTNode:
+        """Object tree (UASTNode) with the same shape."""
+        nodes = [UASTNode(t) for t in map(UAST_TYPES.__getitem__, self.types.tolist())]
+        for index, p in enumerate(self.parent.tolist()):
+            if p >= 0:
+                nodes[p].add_child(nodes[index])
+        return nodes[0]
+
+
+class UASTView:
+    """Read-only UASTNode-like view of one FlatUAST node."""
+
+    __slots__ = ("flat", "index")
+
+    def __init__(self, flat: FlatUAST, index: int):
+        self.flat = flat
+        self.index = index
+
+    @property
+    def node_type(self) -> UASTNodeType:
+        return self.flat.node_type(self.index)
+
+    @property
+    def children(self) -> List["UASTView"]:
+        return [UASTView(self.flat, c) for c in self.flat.children(self.index)]
+
+    @property
+    def depth(self) -> int:
+        return int(self.flat.depth[self.index])
+
+    def is_leaf(self) -> bool:
+        return self.flat.first_child[self.index] < 0
+
+    def __repr__(self):
+        return f"{self.node_type.value}(d={self.depth}, c={len(self.children)})"
@@ -0,0 +1,31 @@
+from typing import Optional
+
+import numpy as np
+
+
+def shared_counts(
+    post_hashes: np.ndarray,
+    post_owners: np.ndarray,
+    n_owners: int,
+    query: np.ndarray,
+    post_weights: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Inverted-index intersection sizes: post_hashes is sorted (with
+    duplicates across owners), post_owners[i] owns post_hashes[i].
+    Returns, per owner, how many of the (unique) query hashes it has,
+    or their total post_weights when given (float).
+    """
+    lo = np.searchsorted(post_hashes, query, side="left")
+    hi = np.searchsorted(post_hashes, query, side="right")
+    counts = hi - lo
+    total = int(counts.sum())
+    if not total:
+        return np.zeros(n_owners, dtype=np.int64 if post_weights is None else np.float64)
+
+    # expand every [lo, hi) range into posting positions
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    positions = starts + np.arange(total)
+    if post_weights is None:
+        return np.bincount(post_owners[positions], minlength=n_owners)
+    return np.bincount(post_owners[positions], weights=post_weights[positions], minlength=n_owners)
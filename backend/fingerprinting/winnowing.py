@@ -1,6 +1,28 @@
 # fingerprinting/winnowing.py
+import os
 import hashlib
-from typing import List, Set
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Set
+
+import numpy as np
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# ------------------------------------------------------
+# Fingerprint versions
+#   md5     -> md5 of the joined k-gram (original format, v1)
+#   rolling -> Rabin–Karp rolling hash over token ids (v2)
+# Fingerprints of different versions are never comparable.
+# ------------------------------------------------------
+FINGERPRINT_VERSIONS = {
+    "md5": 1,
+    "rolling": 2,
+}
+
+WINNOWING_MODE = os.getenv("WINNOWING_MODE", "md5")
+
+# odd 64-bit base for the polynomial rolling hash
+_ROLL_BASE = 0x100000001B3
 
 
 def rolling_hash(tokens: List[str]) -> int:
@@ -11,39 +33,271 @@ def rolling_hash(tokens: List[str]) -> int:
     return int(h, 16) & 0xFFFFFFFFFFFFFFFF  # 64-bit
 
 
-def winnow(tokens: List[str], k: int = 15, window: int = 4) -> Set[int]:
+@lru_cache(maxsize=1 << 18)
+def token_id(token: str) -> int:
+    """
+    Stable 64-bit id of a single token (low 64 bits of its md5).
+    """
+    return int.from_bytes(hashlib.md5(token.encode()).digest()[8:], "big")
+
+
+_MIX_C1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_C2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix64(z: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer (vectorized), spreads rolling hashes
+    before min-selection.
+    """
+    z = (z ^ (z >> np.uint64(30))) * _MIX_C1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_C2
+    return z ^ (z >> np.uint64(31))
+
+
+def rolling_kgram_hashes(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    v2 k-gram hashes from per-token 64-bit values: polynomial hash
+    sum(t[i+j] * B^(k-1-j)) mod 2^64 of every k-gram, mixed.
+    Horner's rule over k shifted views, uint64 arithmetic wraps mod 2^64.
+    """
+    n = len(values) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    values = np.asarray(values, dtype=np.uint64)
+    base = np.uint64(_ROLL_BASE)
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        h = h * base + values[j : j + n]
+    return _mix64(h)
+
+
+def kgram_hashes(
+    tokens: Iterable[str],
+    k: int = 15,
+    mode: str = WINNOWING_MODE,
+    carry: Sequence[str] = (),
+) -> List[int]:
+    """
+    Hashes of every k-gram of carry + tokens that ends inside tokens.
+
+    carry holds (at most k-1) tokens preceding this chunk, which is how
+    k-grams spanning file boundaries are produced.
+    """
+    buf = list(carry)
+    buf.extend(tokens)
+    if len(buf) < k:
+        return []
+
+    if mode == "md5":
+        md5 = hashlib.md5
+        return [
+            int.from_bytes(md5(" ".join(buf[i : i + k]).encode("utf-8")).digest()[8:], "big")
+            for i in range(len(buf) - k + 1)
+        ]
+
+    ids = np.fromiter((token_id(t) for t in buf), dtype=np.uint64, count=len(buf))
+    return rolling_kgram_hashes(ids, k).tolist()
+
+
+def window_minima(values: np.ndarray, w: int) -> np.ndarray:
+    """
+    Minimum of every w-long window of values (len(values) - w + 1 of
+    them), in O(n) whatever w (van Herk / Gil-Werman): within blocks
+    of w, prefix and suffix running minima; a window spans at most two
+    blocks, so its minimum is suffix[start] vs prefix[end]. Replaces
+    the monotonic deque with a few whole-array passes.
+    """
+    n = len(values)
+    if n < w:
+        return np.empty(0, dtype=values.dtype)
+
+    pad = (-n) % w
+    blocks = np.concatenate(
+        [values, np.full(pad, np.iinfo(values.dtype).max, dtype=values.dtype)]
+    ).reshape(-1, w)
+    prefix = np.minimum.accumulate(blocks, axis=1).ravel()
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.minimum(suffix[: n - w + 1], prefix[w - 1 : n])
+
+
+class Winnower:
+    """
+    Incremental winnowing engine.
+
+    - k-gram hashes are produced per chunk, the last k-1 tokens are
+      carried over so k-grams spanning chunks are not lost
+    - window minima are taken per chunk in O(n) (window_minima),
+      the last window-1 hashes are carried over likewise
+    - feeding a repo file by file (or splicing precomputed per-file
+      k-gram hashes) gives the same result as the concatenated stream
+    """
+
+    def __init__(self, k: int = 15, window: int = 4, mode: str = WINNOWING_MODE):
+        if mode not in FINGERPRINT_VERSIONS:
+            raise ValueError(f"Unknown winnowing mode: {mode}")
+
+        self.k = k
+        self.window = window
+        self.mode = mode
+        self.version = FINGERPRINT_VERSIONS[mode]
+
+        self._carry: List[str] = []      # last k-1 tokens seen
+
+        self._pos = 0                    # number of k-gram hashes seen
+        self._recent = np.empty(0, dtype=np.uint64)   # last window-1 hashes
+        self._minima: List[np.ndarray] = []           # selected, per chunk
+        self._pending = 0
+
+    def _advance_carry(self, tokens: Sequence[str]):
+        keep = self.k - 1
+        self._carry = (self._carry + list(tokens))[-keep:] if keep else []
+
+    def update(self, tokens: Iterable[str]) -> "Winnower":
+        tokens = list(tokens)
+        self._select(kgram_hashes(tokens, self.k, self.mode, self._carry))
+        self._advance_carry(tokens)
+        return self
+
+    def splice(
+        self,
+        head: Sequence[str],
+        hashes: Iterable[int],
+        tail: Sequence[str],
+    ) -> "Winnower":
+        """
+        Feed a chunk whose own k-gram hashes were computed separately.
+
+        head / tail are the chunk's first / last k-1 tokens (the whole
+        chunk when it is shorter), hashes = kgram_hashes(chunk, k, mode).
+        """
+        # k-grams that start before the chunk and end inside its head
+        self._select(kgram_hashes(head, self.k, self.mode, self._carry))
+        self._select(hashes)
+
+        if len(head) < self.k - 1:
+            self._advance_carry(head)
+        else:
+            self._carry = list(tail)
+        return self
+
+    # --------------------------------------------------
+    # window selection
+    # --------------------------------------------------
+    def _select(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+
+        w = self.window
+        buf = np.concatenate([self._recent, hashes])
+
+        # every window ending inside this chunk (the carried part is
+        # at most w-1 long, so no window is counted twice)
+        if len(buf) >= w:
+            minima = window_minima(buf, w)
+            self._minima.append(np.unique(minima))
+            self._pending += len(minima)
+            if self._pending > (1 << 20):
+                self._compact()
+
+        self._recent = buf[max(len(buf) - (w - 1), 0):] if w > 1 else buf[:0]
+        self._pos += len(hashes)
+
+    def _compact(self):
+        self._minima = [np.unique(np.concatenate(self._minima))]
+        self._pending = len(self._minima[0])
+
+    def digest_array(self) -> np.ndarray:
+        """Fingerprints as a sorted, unique uint64 array."""
+        parts = list(self._minima)
+
+        # fewer k-grams than the window: one window over all of them
+        if 0 < self._pos < self.window:
+            parts.append(self._recent.min(keepdims=True))
+
+        if not parts:
+            return np.empty(0, dtype=np.uint64)
+        return np.unique(np.concatenate(parts))
+
+    def digest(self) -> Set[int]:
+        return set(self.digest_array().tolist())
+
+
+def winnow(
+    tokens: List[str],
+    k: int = 15,
+    window: int = 4,
+    mode: str = "md5",
+) -> Set[int]:
     """
     Winnowing algorithm (hash-only fingerprints).
     Returns a set of hash values.
+
+    mode="md5" reproduces the original (v1) fingerprints,
+    mode="rolling" is the fast v2 format.
     """
-    n = len(tokens)
-    if n < k:
+    if len(tokens) < k:
         return set()
 
-    # build rolling hashes
-    hashes = [
-        rolling_hash(tokens[i : i + k])
-        for i in range(n - k + 1)
-    ]
+    return Winnower(k=k, window=window, mode=mode).update(tokens).digest()
+
+
+# ------------------------------------------------------
+# Compact storage: sorted uint64 arrays
+# ------------------------------------------------------
+def to_sorted_array(fps) -> np.ndarray:
+    """Set / list / array of fingerprints -> sorted, unique uint64 array."""
+    if isinstance(fps, np.ndarray):
+        return np.unique(fps.astype(np.uint64, copy=False))
+    return np.unique(np.fromiter(fps, dtype=np.uint64, count=len(fps)))
+
 
-    w = min(window, len(hashes))
-    fingerprints = []
+def pack_fingerprints(fps) -> bytes:
+    """Serialize for the fingerprints.data (bytea) column."""
+    return to_sorted_array(fps).astype("<u8", copy=False).tobytes()
+
+
+def unpack_fingerprints(buf) -> np.ndarray:
+    """Zero-copy view of a packed fingerprint array (read-only)."""
+    return np.frombuffer(buf, dtype="<u8")
+
+
+def intersection_size(a: np.ndarray, b: np.ndarray) -> int:
+    """|a ∩ b| for sorted unique arrays, O(n log m) with n <= m."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return 0
+
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = 0
+    return int(np.count_nonzero(b[idx] == a))
+
+
+def jaccard_similarity(fp_a, fp_b) -> float:
+    """Jaccard of two fingerprint sets (Python sets or sorted arrays)."""
+    if not len(fp_a) or not len(fp_b):
+        return 0.0
 
-    for i in range(len(hashes) - w + 1):
-        window_hashes = hashes[i : i + w]
-        min_val = min(window_hashes)
+    if isinstance(fp_a, set) and isinstance(fp_b, set):
+        inter = len(fp_a & fp_b)
+        union = len(fp_a | fp_b)
+        return inter / union
 
-        # rightmost min for stability
-        idx = (w - 1) - window_hashes[::-1].index(min_val)
-        fingerprints.append(min_val)
+    a = fp_a if isinstance(fp_a, np.ndarray) else to_sorted_array(fp_a)
+    b = fp_b if isinstance(fp_b, np.ndarray) else to_sorted_array(fp_b)
 
-    return set(fingerprints)
+    inter = intersection_size(a, b)
+    return inter / (len(a) + len(b) - inter)
 
 
-def jaccard_similarity(fp_a: Set[int], fp_b: Set[int]) -> float:
-    if not fp_a or not fp_b:
+def containment_similarity(fp_a, fp_b) -> float:
+    """Share of fp_a found in fp_b (sorted arrays)."""
+    if not len(fp_a) or not len(fp_b):
         return 0.0
 
-    inter = len(fp_a & fp_b)
-    union = len(fp_a | fp_b)
-    return inter / union
+    a = fp_a if isinstance(fp_a, np.ndarray) else to_sorted_array(fp_a)
+    b = fp_b if isinstance(fp_b, np.ndarray) else to_sorted_array(fp_b)
+    return intersection_size(a, b) / len(a)
@@ -1,22 +1,18 @@
 import re
 
-def clean_code(content: str) -> str:
+from fingerprinting.lexer import GENERIC, LEXERS
+
+def clean_code(content: str, language: str = None) -> str:
     """
     Remove comments & extra whitespace from code.
     Works for Python, JS, C++, Java, HTML.
-    """
-
-    # Remove /* block comments */
-    content = re.sub(r"/\\*.*?\\*/", "", content, flags=re.DOTALL)
 
-    # Remove // single-line comments
-    content = re.sub(r"//.*?$", "", content, flags=re.MULTILINE)
-
-    # Remove # Python comments
-    content = re.sub(r"#.*?$", "", content, flags=re.MULTILINE)
+    With a language (see parsing.language_detector) only that
+    language's comment syntax is removed, e.g. `//` stays in Python.
+    """
 
-    # Remove HTML <!-- --> comments
-    content = re.sub(r"<!--.*?-->", "", content, flags=re.DOTALL)
+    # Remove comments in one pass (/* */, //, #, <!-- -->)
+    content = LEXERS.get(language, GENERIC).strip_comments(content)
 
     # Remove extra blank lines
     content = re.sub(r"\n\s*\n", "\n", content)
@@ -1,4 +1,5 @@
 from preprocessing.cleaner import clean_code
+from fingerprinting.parsing.language_detector import detect_language
 
 def read_file(filepath: str) -> str:
     """
@@ -31,7 +32,7 @@ def extract_clean_chunks(filepath: str):
     Returns: list of cleaned chunks.
     """
     raw = read_file(filepath)
-    cleaned = clean_code(raw)
+    cleaned = clean_code(raw, detect_language(filepath))
     chunks = chunk_text(cleaned)
 
     return chunks
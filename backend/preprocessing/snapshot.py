@@ -0,0 +1,216 @@
+import os
+import errno
+import hashlib
+import logging
+from contextlib import contextmanager
+from functools import cached_property
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from fingerprinting.parsing.language_detector import detect_language
+from fingerprinting.lexer import lex
+
+logger = logging.getLogger(__name__)
+
+# Union of the extensions every agent looks at.
+# Agents narrow this down with RepoSnapshot.select().
+SNAPSHOT_EXTENSIONS = {
+    ".py", ".java", ".md",
+    ".js", ".jsx", ".ts", ".tsx",
+    ".c", ".h", ".cpp", ".cc", ".cxx", ".hpp",
+    ".html", ".css", ".json",
+}
+
+EXCLUDED_FOLDERS = {
+    "node_modules", "__pycache__", ".git",
+    "venv", ".venv", "dist", "build", ".next", "coverage",
+}
+
+
+def iter_repo_files(repo_path: str, extensions: Iterable[str] = SNAPSHOT_EXTENSIONS) -> Iterator[str]:
+    """
+    Single source of truth for which files of a repo are analysed.
+    Walks in sorted order so every consumer sees files in the same order.
+    """
+    extensions = set(extensions)
+
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_FOLDERS)
+        for file in sorted(files):
+            if os.path.splitext(file)[1].lower() in extensions:
+                yield os.path.join(root, file)
+
+
+class SnapshotFile:
+    """
+    One file of a RepoSnapshot.
+    Every view is computed on first access and then kept
+    until release() / close().
+    """
+
+    def __init__(self, path: str, rel_path: str):
+        self.path = path
+        self.rel_path = rel_path
+        # "/"-separated relative path, as in content_identity
+        self.posix_path = rel_path.replace(os.sep, "/")
+        self.ext = os.path.splitext(path)[1].lower()
+        self.language = detect_language(path)
+
+    @cached_property
+    def data(self) -> bytes:
+        """
+        Raw bytes, read at once so no descriptor stays open (empty on
+        read errors; running out of descriptors is raised, not hidden).
+        """
+        try:
+            with open(self.path, "rb") as fh:
+                return fh.read()
+        except OSError as e:
+            if e.errno in (errno.EMFILE, errno.ENFILE):
+                raise
+            logger.debug(f"[SNAPSHOT] Skip {self.path}: {e}")
+            return b""
+
+    @cached_property
+    def size(self) -> int:
+        """Size in bytes, without reading the file if it is not loaded."""
+        if "data" in self.__dict__:
+            return len(self.data)
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @cached_property
+    def text(self) -> str:
+        return str(self.data, "utf-8", "ignore")
+
+    @cached_property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        """Normalized lexical tokens (fingerprinting view)."""
+        return lex(self.text)
+
+    @cached_property
+    def tree(self):
+        """Tree-sitter parse tree, None for unsupported languages."""
+        from fingerprinting.parsing.treesitter_parser import TreeSitterParser
+
+        if not self.language:
+            return None
+        return TreeSitterParser.parse_code(self.text, self.language)
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the raw bytes are loaded (until close())."""
+        return "data" in self.__dict__
+
+    def release(self, views: Iterable[str] = ("text", "tokens", "tree")):
+        """
+        Drop cached derived views (recomputed on next access).
+        Streaming consumers call this so memory does not grow with the repo.
+        """
+        for view in views:
+            self.__dict__.pop(view, None)
+
+    def close(self):
+        self.release()
+        self.__dict__.pop("data", None)
+
+
+class RepoSnapshot:
+    """
+    Read-once view of a repository, shared by all agents of a task.
+
+    - filtered file list (one set of extension / exclusion rules)
+    - raw bytes, decoded text, content hash, language
+    - lazy per-file tokens and parse trees
+    """
+
+    def __init__(self, repo_path: str, extensions: Iterable[str] = SNAPSHOT_EXTENSIONS):
+        self.root = repo_path
+        self.files: List[SnapshotFile] = [
+            SnapshotFile(path, os.path.relpath(path, repo_path))
+            for path in iter_repo_files(repo_path, extensions)
+        ]
+
+    def select(self, extensions: Iterable[str]) -> List[SnapshotFile]:
+        extensions = set(extensions)
+        return [f for f in self.files if f.ext in extensions]
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.files)
+
+
+RepoLike = Union[str, RepoSnapshot]
+
+
+def stream_files(repo: RepoLike, extensions: Iterable[str]) -> Iterator[SnapshotFile]:
+    """
+    Files of a repo one at a time, in snapshot order.
+    For a path, each file is opened lazily and closed once consumed,
+    so only one file is resident at a time.
+    """
+    if isinstance(repo, RepoSnapshot):
+        yield from repo.select(extensions)
+        return
+
+    for path in iter_repo_files(repo, extensions):
+        f = SnapshotFile(path, os.path.relpath(path, repo))
+        try:
+            yield f
+        finally:
+            f.close()
+
+
+def repo_root(repo: RepoLike) -> str:
+    return repo.root if isinstance(repo, RepoSnapshot) else repo
+
+
+def content_identity(repo: RepoLike, extensions: Iterable[str]) -> str:
+    """
+    Merkle hash of a repo's analysed content: sha256 over the sorted
+    (relative path, blob sha256) pairs of the files with these
+    extensions. Changes iff such a file is added, removed, renamed
+    or edited; needs no tokenisation.
+    """
+    return merkle_hash(
+        (f.posix_path, f.content_hash) for f in stream_files(repo, extensions)
+    )
+
+
+def merkle_hash(entries: Iterable[Tuple[str, str]]) -> str:
+    """content_identity from (posix relative path, blob sha256) pairs."""
+    h = hashlib.sha256()
+    for rel_path, blob_hash in sorted(entries):
+        h.update(f"{blob_hash} {rel_path}\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+@contextmanager
+def snapshot_of(repo: RepoLike):
+    """
+    Yield a snapshot for a path or an existing snapshot.
+    Only snapshots created here are closed on exit.
+    """
+    if isinstance(repo, RepoSnapshot):
+        yield repo
+        return
+
+    snapshot = RepoSnapshot(repo)
+    try:
+        yield snapshot
+    finally:
+        snapshot.close()
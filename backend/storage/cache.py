@@ -9,3 +9,15 @@ def cache_set(key: str, value: str, expire: int = 3600):
 def cache_get(key: str):
     data = cache.get(key)
     return data.decode("utf-8") if data else None
+
+def cache_set_bytes(key: str, value: bytes, expire: int = 3600):
+    cache.set(key, value, ex=expire)
+
+def cache_get_bytes(key: str):
+    return cache.get(key)
+
+def cache_publish(channel: str, message: str):
+    cache.publish(channel, message)
+
+def cache_pubsub():
+    return cache.pubsub(ignore_subscribe_messages=True)
@@ -0,0 +1,338 @@
+# storage/corpus_index.py
+import os
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from fingerprinting.hamming_index import hamming_distances
+from fingerprinting.utils import shared_counts
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------
+# Config
+# ------------------------------------------------------
+CORPUS_INDEX_ENABLED = os.getenv("CORPUS_INDEX", "1") == "1"
+CORPUS_CHANNEL = os.getenv("CORPUS_CHANNEL", "corpus:repo_ingested")
+# catch-up interval, pub/sub messages are fire-and-forget
+CORPUS_REFRESH_SECONDS = float(os.getenv("CORPUS_REFRESH_SECONDS", "60"))
+# merge appended segments once there are more than this
+CORPUS_MAX_SEGMENTS = int(os.getenv("CORPUS_MAX_SEGMENTS", "8"))
+
+
+class _Segment:
+    """
+    Immutable block of repos in compact form:
+
+    - per repo: id, url, simhash, token count, fp_version
+    - winnowing: one concatenated uint64 array + offsets (CSR)
+    - postings: the same hashes sorted, with the owning row
+    """
+
+    def __init__(self, repo_ids, urls, simhashes, token_counts, fp_versions, offsets, hashes):
+        self.repo_ids = repo_ids
+        self.urls = urls
+        self.simhashes = simhashes
+        self.token_counts = token_counts
+        self.fp_versions = fp_versions
+        self.offsets = offsets
+        self.hashes = hashes
+
+        owners = np.repeat(np.arange(len(repo_ids), dtype=np.int32), np.diff(offsets))
+        order = np.argsort(hashes, kind="stable")
+        self.post_hashes = hashes[order]
+        self.post_owners = owners[order]
+
+    def __len__(self):
+        return len(self.repo_ids)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "_Segment":
+        arrays = [np.asarray(r["winnowing"], dtype=np.uint64) for r in rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+
+        return cls(
+            repo_ids=np.array([r["repo_id"] for r in rows], dtype=np.int64),
+            urls=[r["repo_url"] for r in rows],
+            simhashes=np.array([r["simhash"] for r in rows], dtype=np.uint64),
+            token_counts=np.array([r["token_count"] for r in rows], dtype=np.int64),
+            fp_versions=np.array([r["fp_version"] for r in rows], dtype=np.int16),
+            offsets=offsets,
+            hashes=np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64),
+        )
+
+    @classmethod
+    def merge(cls, segments: List["_Segment"], alive: List[np.ndarray]) -> "_Segment":
+        """One segment with the alive rows of segments."""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        hashes = []
+        base = 0
+        for seg, rows in zip(segments, alive):
+            rows = np.flatnonzero(rows)
+            sizes = np.diff(seg.offsets)[rows]
+            offsets.append(np.cumsum(sizes) + base)
+            hashes.extend(seg.winnowing(row) for row in rows)
+            base += int(sizes.sum())
+
+        return cls(
+            repo_ids=np.concatenate([s.repo_ids[m] for s, m in zip(segments, alive)]),
+            urls=[u for s, m in zip(segments, alive) for u, keep in zip(s.urls, m) if keep],
+            simhashes=np.concatenate([s.simhashes[m] for s, m in zip(segments, alive)]),
+            token_counts=np.concatenate([s.token_counts[m] for s, m in zip(segments, alive)]),
+            fp_versions=np.concatenate([s.fp_versions[m] for s, m in zip(segments, alive)]),
+            offsets=np.concatenate(offsets),
+            hashes=np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64),
+        )
+
+    def winnowing(self, row: int) -> np.ndarray:
+        return self.hashes[self.offsets[row] : self.offsets[row + 1]]
+
+    def shared_counts(self, query: np.ndarray) -> np.ndarray:
+        """Number of query hashes found in each row's winnowing set."""
+        return shared_counts(self.post_hashes, self.post_owners, len(self), query)
+
+
+class CorpusSnapshot:
+    """
+    Versioned, append-only view of the stored corpus.
+
+    Never mutated: a refresh builds a new snapshot sharing the old
+    segments, so a task holding one is never blocked or disturbed.
+    A re-ingested repo is appended again and its older row masked
+    out in the new snapshot (`alive`, one bool array per segment).
+    """
+
+    def __init__(
+        self,
+        version: int = 0,
+        segments: Optional[List[_Segment]] = None,
+        loaded_txid: int = 0,
+        alive: Optional[List[np.ndarray]] = None,
+    ):
+        self.version = version
+        self.segments = segments or []
+        self.loaded_txid = loaded_txid
+        self.alive = alive if alive is not None else [
+            np.ones(len(seg), dtype=bool) for seg in self.segments
+        ]
+        self._positions = {
+            int(seg.repo_ids[row]): (s, row)
+            for s, seg in enumerate(self.segments)
+            for row in np.flatnonzero(self.alive[s])
+        }
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, repo_id: int):
+        return repo_id in self._positions
+
+    def extended(self, rows: List[Dict[str, Any]], loaded_txid: int) -> "CorpusSnapshot":
+        """New snapshot with rows added, replacing those of known repos."""
+        segments = list(self.segments)
+        alive = list(self.alive)
+
+        replaced = [self._positions[r["repo_id"]] for r in rows if r["repo_id"] in self._positions]
+        for s, row in replaced:
+            if alive[s] is self.alive[s]:
+                alive[s] = alive[s].copy()
+            alive[s][row] = False
+
+        if rows:
+            segments.append(_Segment.from_rows(rows))
+            alive.append(np.ones(len(rows), dtype=bool))
+        if len(segments) > CORPUS_MAX_SEGMENTS:
+            segments = [_Segment.merge(segments, alive)]
+            alive = None
+
+        return CorpusSnapshot(self.version + 1, segments, loaded_txid, alive)
+
+    # --------------------------------------------------
+    # lookups
+    # --------------------------------------------------
+    def candidates(self, repo_ids: List[int]) -> List[Dict[str, Any]]:
+        """Same shape as storage.db.get_candidates_by_ids, order preserved."""
+        out = []
+        for repo_id in repo_ids:
+            if repo_id not in self._positions:
+                continue
+            s, row = self._positions[repo_id]
+            seg = self.segments[s]
+            out.append(
+                {
+                    "repo_id": repo_id,
+                    "repo_url": seg.urls[row],
+                    "simhash": int(seg.simhashes[row]),
+                    "winnowing": seg.winnowing(row),
+                    "token_count": int(seg.token_counts[row]),
+                    "fp_version": int(seg.fp_versions[row]),
+                }
+            )
+        return out
+
+    def rank_by_overlap(
+        self,
+        hashes: np.ndarray,
+        fp_version: int = 1,
+        limit: int = 50,
+        exclude_repo_id: Optional[int] = None,
+    ) -> List[Dict[str, int]]:
+        """
+        In-memory counterpart of storage.db.rank_by_overlap.
+        Returns [{"repo_id", "shared", "n_hashes"}], best Jaccard first.
+        """
+        if not len(hashes) or not self.segments:
+            return []
+
+        query = np.asarray(hashes, dtype=np.uint64)
+        repo_ids, shared, sizes = [], [], []
+        for seg, alive in zip(self.segments, self.alive):
+            counts = seg.shared_counts(query)
+            keep = alive & (counts > 0) & (seg.fp_versions == fp_version)
+            if exclude_repo_id is not None:
+                keep &= seg.repo_ids != exclude_repo_id
+            repo_ids.append(seg.repo_ids[keep])
+            shared.append(counts[keep])
+            sizes.append(np.diff(seg.offsets)[keep])
+
+        repo_ids = np.concatenate(repo_ids)
+        shared = np.concatenate(shared)
+        sizes = np.concatenate(sizes)
+        if not len(repo_ids):
+            return []
+
+        jaccard = shared / np.maximum(len(query) + sizes - shared, 1)
+        order = np.lexsort((repo_ids, -jaccard))[:limit]
+
+        return [
+            {"repo_id": int(repo_ids[i]), "shared": int(shared[i]), "n_hashes": int(sizes[i])}
+            for i in order
+        ]
+
+    def near_duplicates(
+        self,
+        simhash: int,
+        max_distance: int,
+        exclude_repo_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Repos within max_distance SimHash bits, closest first."""
+        found = []
+        for seg, alive in zip(self.segments, self.alive):
+            distances = hamming_distances(simhash, seg.simhashes)
+            for row in np.flatnonzero(alive & (distances <= max_distance)):
+                if seg.repo_ids[row] != exclude_repo_id:
+                    found.append((int(distances[row]), int(seg.repo_ids[row])))
+
+        return [
+            {"repo_id": repo_id, "distance": distance}
+            for distance, repo_id in sorted(found)
+        ]
+
+
+class CorpusIndex:
+    """
+    Worker-resident corpus index.
+
+    Loaded once per worker process by a background thread (tasks use
+    the postings / LSH path until it is ready), then kept current by it
+    listening on CORPUS_CHANNEL (published by ingest_repo) and
+    polling every CORPUS_REFRESH_SECONDS to catch missed messages.
+    Readers take `current` once per task and never wait for a reload.
+    """
+
+    def __init__(self, loader=None):
+        self._loader = loader
+        self._snapshot = CorpusSnapshot()
+        self._refresh_lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self.ready = False
+
+    @property
+    def current(self) -> CorpusSnapshot:
+        return self._snapshot
+
+    def _load(self, after_txid: int):
+        if self._loader is None:
+            from storage.db import load_corpus
+            self._loader = load_corpus
+        return self._loader(after_txid)
+
+    def refresh(self) -> CorpusSnapshot:
+        """Append repos stored (or stored again) since the current snapshot."""
+        with self._refresh_lock:
+            snapshot = self._snapshot
+            rows, loaded_txid = self._load(snapshot.loaded_txid)
+            if rows:
+                snapshot = snapshot.extended(rows, loaded_txid)
+                # single reference swap, readers keep their old snapshot
+                self._snapshot = snapshot
+                logger.info(
+                    f"[CORPUS] v{snapshot.version}: {len(snapshot)} repos "
+                    f"(+{len(rows)})"
+                )
+            self.ready = True
+            return snapshot
+
+    def start(self):
+        """
+        Initial load and refreshes in a background thread: returns at
+        once, so a large corpus does not hold up the worker process.
+        """
+        if self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen,
+                name="corpus-index",
+                daemon=True,
+            )
+            self._listener.start()
+
+    def _listen(self):
+        pubsub = None
+        try:
+            from storage.cache import cache_pubsub
+            pubsub = cache_pubsub()
+            pubsub.subscribe(CORPUS_CHANNEL)
+        except Exception as e:
+            logger.warning(f"[CORPUS] Pub/sub disabled, polling only: {e}")
+            pubsub = None
+
+        while True:
+            try:
+                # the first pass is the initial load (retried on errors)
+                if self.ready:
+                    if pubsub is not None:
+                        pubsub.get_message(timeout=CORPUS_REFRESH_SECONDS)
+                    else:
+                        threading.Event().wait(CORPUS_REFRESH_SECONDS)
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"[CORPUS] Refresh failed: {e}")
+                threading.Event().wait(CORPUS_REFRESH_SECONDS)
+
+
+def publish_ingested(repo_id: int):
+    """Tell every worker's corpus index that a repo was stored."""
+    try:
+        from storage.cache import cache_publish
+        cache_publish(CORPUS_CHANNEL, str(repo_id))
+    except Exception as e:
+        logger.debug(f"[CORPUS] Publish failed: {e}")
+
+
+_corpus_index = CorpusIndex()
+
+
+def start_corpus_index():
+    """Called once per worker process (celery worker_process_init)."""
+    if CORPUS_INDEX_ENABLED:
+        _corpus_index.start()
+
+
+def get_corpus_index() -> Optional[CorpusIndex]:
+    """Process-wide index, None until started in this process."""
+    if not CORPUS_INDEX_ENABLED or not _corpus_index.ready:
+        return None
+    return _corpus_index
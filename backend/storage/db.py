@@ -1,6 +1,7 @@
 # storage/db.py
 import os
 from typing import Optional, List, Dict, Any
+import numpy as np
 from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine,
@@ -9,14 +10,20 @@ from sqlalchemy import (
     String,
     Float,
     JSON,
+    BigInteger,
+    LargeBinary,
     ForeignKey,
     DateTime,
+    Index,
+    UniqueConstraint,
     text,
 )
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import insert
 
+from fingerprinting.winnowing import to_sorted_array, unpack_fingerprints
+
 # ------------------------------------------------------
 # Load environment
 # ------------------------------------------------------
@@ -44,13 +51,65 @@ class Repository(Base):
 
 class Fingerprint(Base):
     __tablename__ = "fingerprints"
+    __table_args__ = (
+        UniqueConstraint("repo_id", "agent"),
+        Index("ix_fingerprints_txid", "txid"),
+    )
 
     id = Column(Integer, primary_key=True)
     repo_id = Column(Integer, ForeignKey("repositories.id", ondelete="CASCADE"))
     agent = Column(String, nullable=False)  # simhash | winnowing
     score = Column(Float)
     extra_data = Column(JSON)     
+    data = Column(LargeBinary)    # packed sorted uint64 array (winnowing)
     created_at = Column(DateTime, server_default=func.now())
+    # last writing transaction, row version of the worker-side indexes
+    txid = Column(BigInteger, nullable=False, server_default=text("txid_current()"))
+
+
+class LSHBand(Base):
+    """MinHash LSH bucket membership of a repository (one row per band)."""
+    __tablename__ = "lsh_bands"
+    __table_args__ = (
+        Index("ix_lsh_bands_band_bucket", "band", "bucket"),
+        Index("ix_lsh_bands_txid", "txid"),
+    )
+
+    repo_id = Column(
+        Integer,
+        ForeignKey("repositories.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    band = Column(Integer, primary_key=True)
+    bucket = Column(BigInteger, nullable=False)
+    # writing transaction, row version of the worker-side mirrors
+    txid = Column(BigInteger, nullable=False, server_default=text("txid_current()"))
+
+
+class FingerprintPosting(Base):
+    """Inverted index: winnowing hash -> repositories containing it."""
+    __tablename__ = "fingerprint_postings"
+    __table_args__ = (Index("ix_fingerprint_postings_repo_id", "repo_id"),)
+
+    # uint64 hash stored bit-for-bit as a signed BIGINT
+    hash = Column(BigInteger, primary_key=True)
+    repo_id = Column(
+        Integer,
+        ForeignKey("repositories.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+
+class FileContribution(Base):
+    """
+    Per-file fingerprint contribution (storage.fingerprint_cache
+    encode_value of a FileFingerprint), shared by every worker.
+    """
+    __tablename__ = "file_fingerprints"
+
+    namespace = Column(String, primary_key=True)   # manager.cache_namespace
+    blob_hash = Column(String, primary_key=True)   # sha256 of the file bytes
+    data = Column(LargeBinary, nullable=False)
 
 
 # ------------------------------------------------------
@@ -60,6 +119,31 @@ def get_db():
     return SessionLocal()
 
 
+def init_db():
+    """Create missing tables / columns (existing data is left untouched)."""
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE fingerprints ADD COLUMN IF NOT EXISTS data BYTEA"))
+        for table in ("fingerprints", "lsh_bands"):
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "
+                "txid BIGINT NOT NULL DEFAULT txid_current()"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_txid ON {table} (txid)"))
+
+
+def _txid_horizon(db) -> int:
+    """
+    Transaction id below which every transaction has ended, read
+    before a "txid >= watermark" query: rows written later (or by a
+    transaction still open) all have txid >= it, so it is the next
+    watermark. Rows at or above it may be read twice, loaders' callers
+    replace rather than append.
+    """
+    return int(db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar())
+
+
 # ------------------------------------------------------
 # REPOSITORY FUNCTIONS
 # ------------------------------------------------------
@@ -89,6 +173,18 @@ def save_repository(repo_url: str, content_hash: str) -> int:
     return repo.id
 
 
+def get_repository_id(repo_url: str, content_hash: str) -> Optional[int]:
+    """Id of an already ingested (repo_url, content_hash) snapshot."""
+    db = get_db()
+    repo = (
+        db.query(Repository)
+        .filter_by(repo_url=repo_url, content_hash=content_hash)
+        .first()
+    )
+    db.close()
+    return repo.id if repo else None
+
+
 def get_repo_by_hash(content_hash: str) -> Optional[int]:
     """
     Identity detection by content hash.
@@ -107,6 +203,7 @@ def save_fingerprint(
     agent: str,
     score: float,
     extra_data: Dict[str, Any] | None = None,
+    data: bytes | None = None,
 ):
     db = get_db()
 
@@ -115,11 +212,14 @@ def save_fingerprint(
         agent=agent,
         score=score,
         extra_data=extra_data or {},   
+        data=data,
     ).on_conflict_do_update(
         index_elements=["repo_id", "agent"],
         set_={
             "score": score,
             "extra_data": extra_data or {},  
+            "data": data,
+            "txid": func.txid_current(),
         },
     )
 
@@ -130,36 +230,139 @@ def save_fingerprint(
 
 
 # ------------------------------------------------------
-# DB-FIRST FINGERPRINT FETCH (CRITICAL)
+# PER-FILE CONTRIBUTIONS
 # ------------------------------------------------------
-def get_simhash_candidates(limit: int = 50):
+def load_file_fingerprints(namespace: str, blob_hashes: List[str]) -> Dict[str, bytes]:
+    """Stored contributions of these blobs, by blob hash."""
+    if not blob_hashes:
+        return {}
+
     db = get_db()
 
     rows = db.execute(
         text(
             """
-            SELECT
-                r.repo_url,
+            SELECT blob_hash, data
+            FROM file_fingerprints
+            WHERE namespace = :namespace
+                AND blob_hash = ANY(CAST(:blob_hashes AS TEXT[]));
+            """
+        ),
+        {"namespace": namespace, "blob_hashes": list(blob_hashes)},
+    ).fetchall()
 
-                fs.extra_data->>'simhash' AS simhash,
-                fs.extra_data->>'token_count' AS simhash_tokens,
+    db.close()
+    return {r.blob_hash: bytes(r.data) for r in rows}
 
-                fw.extra_data->'winnowing' AS winnowing,
-                fw.extra_data->>'token_count' AS winnowing_tokens
 
-            FROM repositories r
-            LEFT JOIN fingerprints fs
-                ON r.id = fs.repo_id AND fs.agent = 'simhash'
-            LEFT JOIN fingerprints fw
-                ON r.id = fw.repo_id AND fw.agent = 'winnowing'
-            LIMIT :limit;
-            """
-        ),
+def save_file_fingerprints(namespace: str, entries: Dict[str, bytes]):
+    """Insert contributions of new blobs (a blob's never changes)."""
+    if not entries:
+        return
+
+    db = get_db()
+
+    db.execute(
+        insert(FileContribution).on_conflict_do_nothing(),
+        [
+            {"namespace": namespace, "blob_hash": blob_hash, "data": data}
+            for blob_hash, data in entries.items()
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+# ------------------------------------------------------
+# DB-FIRST FINGERPRINT FETCH (CRITICAL)
+# ------------------------------------------------------
+_CANDIDATE_SELECT = """
+    SELECT
+        r.id AS repo_id,
+        r.repo_url,
+
+        fs.extra_data->>'simhash' AS simhash,
+        fs.extra_data->>'token_count' AS simhash_tokens,
+
+        {winnowing}
+        fw.extra_data->>'token_count' AS winnowing_tokens,
+        fw.extra_data->>'fp_version' AS fp_version
+
+    FROM repositories r
+    LEFT JOIN fingerprints fs
+        ON r.id = fs.repo_id AND fs.agent = 'simhash'
+    LEFT JOIN fingerprints fw
+        ON r.id = fw.repo_id AND fw.agent = 'winnowing'
+"""
+
+
+def _candidate_select(with_winnowing: bool = True) -> str:
+    if with_winnowing:
+        columns = "fw.data AS winnowing_data, fw.extra_data->'winnowing' AS winnowing,"
+    else:
+        columns = "NULL AS winnowing_data, NULL AS winnowing,"
+    return _CANDIDATE_SELECT.format(winnowing=columns)
+
+
+def get_simhash_candidates(limit: int = 50):
+    db = get_db()
+
+    rows = db.execute(
+        text(_candidate_select() + " LIMIT :limit;"),
         {"limit": limit},
     ).fetchall()
 
     db.close()
 
+    return _rows_to_candidates(rows)
+
+
+def get_candidates_by_ids(repo_ids: List[int], with_winnowing: bool = True):
+    """
+    Same shape as get_simhash_candidates, for an explicit id list
+    (e.g. LSH hits). Order of repo_ids is preserved.
+    with_winnowing=False skips the hash arrays (empty in the result).
+    """
+    if not repo_ids:
+        return []
+
+    db = get_db()
+
+    rows = db.execute(
+        text(_candidate_select(with_winnowing) + " WHERE r.id = ANY(:ids);"),
+        {"ids": list(repo_ids)},
+    ).fetchall()
+
+    db.close()
+
+    by_id = {c["repo_id"]: c for c in _rows_to_candidates(rows)}
+    return [by_id[i] for i in repo_ids if i in by_id]
+
+
+def load_corpus(after_txid: int = 0):
+    """
+    (candidate rows with winnowing arrays for every repo whose
+    fingerprints were written since after_txid, next after_txid).
+    Rewritten fingerprints come again, the caller replaces them.
+    Used by the worker corpus index.
+    """
+    db = get_db()
+
+    horizon = _txid_horizon(db)
+    rows = db.execute(
+        text(
+            _candidate_select()
+            + " WHERE fw.id IS NOT NULL AND (fw.txid >= :after OR fs.txid >= :after)"
+            + " ORDER BY r.id;"
+        ),
+        {"after": after_txid},
+    ).fetchall()
+
+    db.close()
+    return _rows_to_candidates(rows), horizon
+
+
+def _rows_to_candidates(rows):
     candidates = []
 
     for r in rows:
@@ -173,18 +376,274 @@ def get_simhash_candidates(limit: int = 50):
         except Exception:
             token_count = 0
 
+        # packed bytea (current) or JSON list (legacy rows)
+        try:
+            if r.winnowing_data is not None:
+                winnowing_fp = unpack_fingerprints(r.winnowing_data)
+            else:
+                winnowing_fp = to_sorted_array(r.winnowing or [])
+        except Exception:
+            winnowing_fp = to_sorted_array([])
+
+        # rows written before versioning are md5 (v1) fingerprints
         try:
-            winnowing_fp = set(r.winnowing) if r.winnowing else set()
+            fp_version = int(r.fp_version) if r.fp_version else 1
         except Exception:
-            winnowing_fp = set()
+            fp_version = 1
 
         candidates.append(
             {
+                "repo_id": r.repo_id,
                 "repo_url": r.repo_url,
                 "simhash": simhash_val,
                 "winnowing": winnowing_fp,
                 "token_count": token_count,
+                "fp_version": fp_version,
             }
         )
 
     return candidates
+
+
+def load_simhashes(after_txid: int = 0):
+    """
+    ([(repo_id, simhash)] written since after_txid, next after_txid).
+    Used to build / refresh the worker-side Hamming index.
+    """
+    db = get_db()
+
+    horizon = _txid_horizon(db)
+    rows = db.execute(
+        text(
+            """
+            SELECT repo_id, extra_data->>'simhash' AS simhash
+            FROM fingerprints
+            WHERE agent = 'simhash' AND txid >= :after
+            ORDER BY repo_id;
+            """
+        ),
+        {"after": after_txid},
+    ).fetchall()
+
+    db.close()
+
+    out = []
+    for r in rows:
+        try:
+            out.append((r.repo_id, int(r.simhash)))
+        except (TypeError, ValueError):
+            continue
+    return out, horizon
+
+
+def get_legacy_winnowing_rows(limit: int = 500):
+    """Winnowing rows still storing the hash list as JSON."""
+    db = get_db()
+
+    rows = db.execute(
+        text(
+            """
+            SELECT id, extra_data
+            FROM fingerprints
+            WHERE agent = 'winnowing' AND data IS NULL
+            ORDER BY id
+            LIMIT :limit;
+            """
+        ),
+        {"limit": limit},
+    ).fetchall()
+
+    db.close()
+    return [(r.id, r.extra_data or {}) for r in rows]
+
+
+def update_fingerprint_data(fingerprint_id: int, extra_data: Dict[str, Any], data: bytes):
+    db = get_db()
+
+    db.query(Fingerprint).filter_by(id=fingerprint_id).update(
+        {"extra_data": extra_data, "data": data, "txid": func.txid_current()},
+        synchronize_session=False,
+    )
+    db.commit()
+    db.close()
+
+
+# ------------------------------------------------------
+# LSH BAND STORAGE
+# ------------------------------------------------------
+def save_lsh_bands(repo_id: int, keys: List[int]):
+    db = get_db()
+
+    db.execute(text("DELETE FROM lsh_bands WHERE repo_id = :repo_id"), {"repo_id": repo_id})
+    db.execute(
+        LSHBand.__table__.insert(),
+        [
+            {"repo_id": repo_id, "band": band, "bucket": bucket}
+            for band, bucket in enumerate(keys)
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+def load_lsh_bands(after_txid: int = 0):
+    """
+    ((repo_id, band, bucket) rows written since after_txid, next
+    after_txid). All bands of a repo are written together, so a repo
+    comes with its full current set. Used to build / incrementally
+    refresh the worker-side mirror.
+    """
+    db = get_db()
+
+    horizon = _txid_horizon(db)
+    rows = db.execute(
+        text(
+            """
+            SELECT repo_id, band, bucket
+            FROM lsh_bands
+            WHERE txid >= :after
+            ORDER BY repo_id, band;
+            """
+        ),
+        {"after": after_txid},
+    ).fetchall()
+
+    db.close()
+    return [(r.repo_id, r.band, r.bucket) for r in rows], horizon
+
+
+def get_repos_without_lsh():
+    """Repositories ingested before LSH banding existed."""
+    db = get_db()
+
+    rows = db.execute(
+        text(
+            """
+            SELECT r.id
+            FROM repositories r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM lsh_bands b WHERE b.repo_id = r.id
+            )
+            ORDER BY r.id;
+            """
+        )
+    ).fetchall()
+
+    db.close()
+    return [r.id for r in rows]
+
+
+# ------------------------------------------------------
+# WINNOWING POSTINGS (inverted index)
+# ------------------------------------------------------
+def _signed(hashes) -> List[int]:
+    return np.asarray(hashes, dtype=np.uint64).view(np.int64).tolist()
+
+
+def save_postings(repo_id: int, hashes):
+    """Replace the postings of a repository with its winnowing hashes."""
+    db = get_db()
+
+    db.execute(text("DELETE FROM fingerprint_postings WHERE repo_id = :repo_id"), {"repo_id": repo_id})
+    if len(hashes):
+        db.execute(
+            text(
+                """
+                INSERT INTO fingerprint_postings (hash, repo_id)
+                SELECT DISTINCT unnest(CAST(:hashes AS BIGINT[])), :repo_id
+                ON CONFLICT DO NOTHING;
+                """
+            ),
+            {"hashes": _signed(hashes), "repo_id": repo_id},
+        )
+    db.commit()
+    db.close()
+
+
+def rank_by_overlap(
+    hashes,
+    fp_version: int = 1,
+    limit: int = 50,
+    repo_ids: Optional[List[int]] = None,
+    exclude_repo_id: Optional[int] = None,
+):
+    """
+    Repos sharing winnowing hashes with `hashes`, ranked by Jaccard
+    shared / (|input| + |repo| - shared), computed in Postgres.
+    Cost grows with the number of input hashes, not the corpus size.
+    exclude_repo_id (the input repo itself) is left out.
+
+    Returns [{"repo_id", "shared", "n_hashes"}], best first.
+    """
+    if not len(hashes):
+        return []
+
+    only_ids = "AND p.repo_id = ANY(:repo_ids)" if repo_ids is not None else ""
+    if exclude_repo_id is not None:
+        only_ids += " AND p.repo_id <> :exclude_repo_id"
+
+    db = get_db()
+
+    rows = db.execute(
+        text(
+            f"""
+            SELECT repo_id, shared, n_hashes
+            FROM (
+                SELECT
+                    p.repo_id,
+                    COUNT(*) AS shared,
+                    COALESCE(
+                        (fw.extra_data->>'count')::int,
+                        json_array_length(fw.extra_data->'winnowing'),
+                        0
+                    ) AS n_hashes
+                FROM fingerprint_postings p
+                JOIN fingerprints fw
+                    ON fw.repo_id = p.repo_id AND fw.agent = 'winnowing'
+                WHERE p.hash = ANY(CAST(:hashes AS BIGINT[]))
+                    AND COALESCE((fw.extra_data->>'fp_version')::int, 1) = :fp_version
+                    {only_ids}
+                GROUP BY p.repo_id, fw.id
+            ) overlap
+            ORDER BY
+                shared::float8 / GREATEST(:n_input + n_hashes - shared, 1) DESC,
+                repo_id
+            LIMIT :limit;
+            """
+        ),
+        {
+            "hashes": _signed(hashes),
+            "n_input": len(hashes),
+            "fp_version": fp_version,
+            "repo_ids": list(repo_ids or []),
+            "exclude_repo_id": exclude_repo_id,
+            "limit": limit,
+        },
+    ).fetchall()
+
+    db.close()
+    return [
+        {"repo_id": r.repo_id, "shared": int(r.shared), "n_hashes": int(r.n_hashes)}
+        for r in rows
+    ]
+
+
+def get_repos_without_postings():
+    """Repositories ingested before the postings index existed."""
+    db = get_db()
+
+    rows = db.execute(
+        text(
+            """
+            SELECT r.id
+            FROM repositories r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM fingerprint_postings p WHERE p.repo_id = r.id
+            )
+            ORDER BY r.id;
+            """
+        )
+    ).fetchall()
+
+    db.close()
+    return [r.id for r in rows]
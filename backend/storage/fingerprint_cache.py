@@ -0,0 +1,342 @@
+# storage/fingerprint_cache.py
+import os
+import json
+import logging
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from storage.file_manager import BASE_DATA
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------
+# Config
+# ------------------------------------------------------
+FP_CACHE_ENABLED = os.getenv("FP_CACHE", "1") == "1"
+FP_CACHE_DIR = os.getenv("FP_CACHE_DIR", os.path.join(BASE_DATA, "fp_cache"))
+FP_CACHE_MAX_ENTRIES = int(os.getenv("FP_CACHE_MAX_ENTRIES", "200000"))
+FP_CACHE_MEMORY_ENTRIES = int(os.getenv("FP_CACHE_MEMORY_ENTRIES", "20000"))
+FP_CACHE_REDIS = os.getenv("FP_CACHE_REDIS", "0") == "1"
+FP_CACHE_REDIS_TTL = int(os.getenv("FP_CACHE_REDIS_TTL", str(7 * 24 * 3600)))
+
+# an eviction pass keeps this share of max_entries, so the directory
+# is walked once per ~10% of max_entries new entries, not per write
+_EVICT_KEEP = 0.9
+
+
+# ------------------------------------------------------
+# Data-only serialization
+#
+# Entries are read back from a shared directory and from Redis, so
+# they are never unpickled. A value is a JSON tree (None, bool, int,
+# float, str, list, tuple, @cacheable dataclass); its numpy arrays are
+# appended as raw bytes, described in the tree by (dtype, shape,
+# offset) and read back with np.frombuffer (no object dtypes).
+#   b"FPC1" | uint32 header length | JSON header | array bytes
+# ------------------------------------------------------
+_MAGIC = b"FPC1"
+_CACHE_TYPES: Dict[str, type] = {}
+
+
+def cacheable(cls):
+    """Class decorator: allow instances of a dataclass as cache values."""
+    _CACHE_TYPES[cls.__name__] = cls
+    return cls
+
+
+def _to_tree(value: Any, arrays: List[np.ndarray]) -> Any:
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("object arrays are not cacheable")
+        arrays.append(np.ascontiguousarray(value))
+        return {"a": len(arrays) - 1}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, tuple):
+        return {"t": [_to_tree(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_to_tree(v, arrays) for v in value]
+    name = type(value).__name__
+    if dataclasses.is_dataclass(value) and _CACHE_TYPES.get(name) is type(value):
+        return {
+            "d": name,
+            "f": {f.name: _to_tree(getattr(value, f.name), arrays) for f in dataclasses.fields(value)},
+        }
+    raise TypeError(f"{name} is not cacheable")
+
+
+def _from_tree(tree: Any, arrays: List[np.ndarray]) -> Any:
+    if isinstance(tree, list):
+        return [_from_tree(v, arrays) for v in tree]
+    if not isinstance(tree, dict):
+        return tree
+    if "a" in tree:
+        return arrays[tree["a"]]
+    if "t" in tree:
+        return tuple(_from_tree(v, arrays) for v in tree["t"])
+    cls = _CACHE_TYPES[tree["d"]]
+    return cls(**{k: _from_tree(v, arrays) for k, v in tree["f"].items()})
+
+
+def encode_value(value: Any) -> bytes:
+    arrays: List[np.ndarray] = []
+    tree = _to_tree(value, arrays)
+    header = json.dumps({
+        "v": tree,
+        "arrays": [[a.dtype.str, list(a.shape)] for a in arrays],
+    }).encode()
+    return b"".join([_MAGIC, len(header).to_bytes(4, "little"), header, *(a.tobytes() for a in arrays)])
+
+
+def decode_value(data: bytes) -> Any:
+    if data[:4] != _MAGIC:
+        raise ValueError("not a cache entry")
+    size = int.from_bytes(data[4:8], "little")
+    header = json.loads(data[8 : 8 + size])
+
+    arrays = []
+    offset = 8 + size
+    for dtype_str, shape in header["arrays"]:
+        dtype = np.dtype(dtype_str)
+        if dtype.hasobject:
+            raise ValueError("object arrays are not cacheable")
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape))
+        offset += count * dtype.itemsize
+    return _from_tree(header["v"], arrays)
+
+
+class FileFingerprintCache:
+    """
+    Content-addressed cache of per-file fingerprint data.
+
+    Keys are (namespace, blob_hash). The namespace encodes what was
+    computed and with which parameters (e.g. "lex-v1-k15"), so a
+    parameter change never returns stale entries.
+
+    Values are stored data-only (encode_value), never pickled.
+
+    Tiers:
+    1. in-process LRU
+    2. local disk, LRU by mtime (touched on every hit); the entry
+       count is taken by one background scan, then kept up to date on
+       writes, and eviction runs in the background once it is exceeded
+    3. optional Redis (FP_CACHE_REDIS=1), shared between workers
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = FP_CACHE_DIR,
+        max_entries: int = FP_CACHE_MAX_ENTRIES,
+        memory_entries: int = FP_CACHE_MEMORY_ENTRIES,
+        use_redis: bool = FP_CACHE_REDIS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # disk entries: None until the startup scan ends (writes made
+        # meanwhile are in _pending), _evicting while a pass runs
+        self._entries: Optional[int] = None
+        self._pending = 0
+        self._evicting = False
+        threading.Thread(target=self._scan, name="fp-cache-scan", daemon=True).start()
+
+        self._redis = None
+        if use_redis:
+            try:
+                from storage import cache as redis_tier
+                self._redis = redis_tier
+            except Exception as e:
+                logger.warning(f"[FP CACHE] Redis tier disabled: {e}")
+
+    # --------------------------------------------------
+    # public API
+    # --------------------------------------------------
+    def get(self, namespace: str, blob_hash: str) -> Optional[Any]:
+        key = f"{namespace}:{blob_hash}"
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        value = self._disk_get(namespace, blob_hash)
+
+        if value is None and self._redis is not None:
+            data = self._redis_get(key)
+            if data is not None:
+                value = self._decode(key, data)
+                if value is not None:
+                    self._disk_put(namespace, blob_hash, data)
+
+        if value is not None:
+            self._memory_put(key, value)
+        return value
+
+    def put(self, namespace: str, blob_hash: str, value: Any):
+        key = f"{namespace}:{blob_hash}"
+
+        self._memory_put(key, value)
+        try:
+            data = encode_value(value)
+        except Exception as e:
+            logger.debug(f"[FP CACHE] Not serializable {key}: {e}")
+            return
+        self._disk_put(namespace, blob_hash, data)
+
+        if self._redis is not None:
+            try:
+                self._redis.cache_set_bytes(
+                    f"fpcache-v2:{key}",
+                    data,
+                    expire=FP_CACHE_REDIS_TTL,
+                )
+            except Exception as e:
+                logger.debug(f"[FP CACHE] Redis put failed: {e}")
+
+    # --------------------------------------------------
+    # memory tier
+    # --------------------------------------------------
+    def _memory_put(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # --------------------------------------------------
+    # disk tier
+    # --------------------------------------------------
+    def _path(self, namespace: str, blob_hash: str) -> str:
+        return os.path.join(self.cache_dir, namespace, blob_hash[:2], f"{blob_hash}.fpc")
+
+    @staticmethod
+    def _decode(where: str, data: bytes) -> Optional[Any]:
+        try:
+            return decode_value(data)
+        except Exception as e:
+            logger.debug(f"[FP CACHE] Corrupt entry {where}: {e}")
+            return None
+
+    def _disk_get(self, namespace: str, blob_hash: str) -> Optional[Any]:
+        path = self._path(namespace, blob_hash)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.debug(f"[FP CACHE] Unreadable entry {path}: {e}")
+            return None
+
+        value = self._decode(path, data)
+        if value is not None:
+            try:
+                os.utime(path)  # LRU: mark as recently used
+            except OSError:
+                pass
+        return value
+
+    def _disk_put(self, namespace: str, blob_hash: str, data: bytes):
+        path = self._path(namespace, blob_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            added = not os.path.exists(path)
+            with open(tmp_path, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.debug(f"[FP CACHE] Disk put failed {path}: {e}")
+            return
+
+        if added:
+            self._count_added()
+
+    def _count_added(self):
+        with self._lock:
+            if self._entries is None:
+                self._pending += 1
+                return
+            self._entries += 1
+            evict = self._entries > self.max_entries and not self._evicting
+            if evict:
+                self._evicting = True
+        if evict:
+            threading.Thread(target=self._evict, name="fp-cache-evict", daemon=True).start()
+
+    def _scan(self):
+        count = sum(len(files) for _, _, files in os.walk(self.cache_dir))
+        with self._lock:
+            self._entries = count + self._pending
+            self._pending = 0
+            evict = self._entries > self.max_entries and not self._evicting
+            if evict:
+                self._evicting = True
+        if evict:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries down to _EVICT_KEEP."""
+        remaining = None
+        try:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((os.stat(path).st_mtime, path))
+                    except OSError:
+                        continue
+
+            entries.sort()
+            excess = len(entries) - int(self.max_entries * _EVICT_KEEP)
+            removed = 0
+            for _, path in entries[: max(excess, 0)]:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+
+            if removed:
+                logger.info(f"[FP CACHE] Evicted {removed} entries")
+            remaining = len(entries) - removed
+        finally:
+            with self._lock:
+                # recounted by the walk (writes racing it may be missed)
+                if remaining is not None:
+                    self._entries = remaining
+                self._evicting = False
+
+    # --------------------------------------------------
+    # redis tier
+    # --------------------------------------------------
+    def _redis_get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._redis.cache_get_bytes(f"fpcache-v2:{key}") or None
+        except Exception as e:
+            logger.debug(f"[FP CACHE] Redis get failed: {e}")
+            return None
+
+
+_file_cache: Optional[FileFingerprintCache] = None
+
+
+def get_file_cache() -> Optional[FileFingerprintCache]:
+    """Process-wide cache, None when disabled with FP_CACHE=0."""
+    global _file_cache
+    if not FP_CACHE_ENABLED:
+        return None
+    if _file_cache is None:
+        _file_cache = FileFingerprintCache()
+    return _file_cache
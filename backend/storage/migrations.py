@@ -0,0 +1,124 @@
+# storage/migrations.py
+"""
+One-off data migrations for fingerprints stored by older versions.
+
+Usage (from backend/):
+    python -m storage.migrations schema   # create missing tables / columns
+    python -m storage.migrations lsh      # build LSH bands for old repos
+    python -m storage.migrations binary   # JSON winnowing lists -> packed bytea
+    python -m storage.migrations postings # build the winnowing inverted index
+"""
+import os
+import sys
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config.logger import logger
+from storage.db import (
+    init_db,
+    get_candidates_by_ids,
+    get_repos_without_lsh,
+    get_repos_without_postings,
+    get_legacy_winnowing_rows,
+    save_lsh_bands,
+    save_postings,
+    update_fingerprint_data,
+)
+from fingerprinting.winnowing import pack_fingerprints
+
+
+def backfill_lsh_bands(batch_size: int = 200) -> int:
+    """
+    Compute LSH bands for repositories ingested before banding existed.
+    Returns the number of repositories indexed.
+    """
+    from agents.fingerprint_agent import FingerprintAgent
+
+    agent = FingerprintAgent()
+    repo_ids = get_repos_without_lsh()
+    done = 0
+
+    for start in range(0, len(repo_ids), batch_size):
+        for cand in get_candidates_by_ids(repo_ids[start : start + batch_size]):
+            if not len(cand["winnowing"]):
+                continue
+            save_lsh_bands(cand["repo_id"], agent.lsh_keys(cand))
+            done += 1
+
+        logger.info(f"[MIGRATE] LSH bands: {done}/{len(repo_ids)}")
+
+    return done
+
+
+def pack_winnowing_rows(batch_size: int = 500) -> int:
+    """
+    Move winnowing hashes stored as a JSON list in extra_data
+    to the packed bytea column. Returns the number of rows converted.
+    """
+    done = 0
+
+    while True:
+        rows = get_legacy_winnowing_rows(limit=batch_size)
+        if not rows:
+            break
+
+        for fingerprint_id, extra in rows:
+            hashes = extra.pop("winnowing", None) or []
+            extra["format"] = "u64"
+            extra["count"] = len(set(hashes))
+            update_fingerprint_data(fingerprint_id, extra, pack_fingerprints(hashes))
+            done += 1
+
+        logger.info(f"[MIGRATE] Packed winnowing rows: {done}")
+
+    return done
+
+
+def backfill_postings(batch_size: int = 200) -> int:
+    """
+    Add repositories ingested before the postings index existed.
+    Returns the number of repositories indexed.
+    """
+    repo_ids = get_repos_without_postings()
+    done = 0
+
+    for start in range(0, len(repo_ids), batch_size):
+        for cand in get_candidates_by_ids(repo_ids[start : start + batch_size]):
+            if not len(cand["winnowing"]):
+                continue
+            save_postings(cand["repo_id"], cand["winnowing"])
+            done += 1
+
+        logger.info(f"[MIGRATE] Postings: {done}/{len(repo_ids)}")
+
+    return done
+
+
+def create_schema() -> int:
+    """
+    Create missing tables / columns. Run once before starting workers
+    (and before the data migrations, which all do it first).
+    """
+    init_db()
+    return 0
+
+
+MIGRATIONS = {
+    "schema": create_schema,
+    "binary": pack_winnowing_rows,
+    "lsh": backfill_lsh_bands,
+    "postings": backfill_postings,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(MIGRATIONS)
+
+    create_schema()
+    for name in names:
+        if name != "schema":
+            MIGRATIONS[name]()
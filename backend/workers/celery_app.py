@@ -9,6 +9,7 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from celery import Celery
+from celery.signals import worker_process_init
 from config.settings import settings
 
 celery_app = Celery(
@@ -29,3 +30,19 @@ celery_app.conf.update(
     worker_concurrency=4,
     task_track_started=True,
 )
+
+
+@worker_process_init.connect
+def init_worker_process(**_):
+    # the schema is created once by `python -m storage.migrations schema`,
+    # not by every prefork child (concurrent DDL races on first start)
+
+    # warm in-memory corpus for candidate retrieval, loaded and kept
+    # current (Redis pub/sub) in a background thread; tasks fall back
+    # to the DB until it is ready
+    from config.logger import logger
+    from storage.corpus_index import start_corpus_index
+    try:
+        start_corpus_index()
+    except Exception as e:
+        logger.warning(f"[CORPUS] Index not loaded: {e}")
@@ -18,8 +18,9 @@ from celery import shared_task
 from config.logger import logger
 from agents.fingerprint_agent import FingerprintAgent
 from core.orchestrator import Orchestrator
+from core.utils import timed
 from storage.file_manager import save_repo_temp
-from storage.db import get_simhash_candidates
+from preprocessing.snapshot import RepoSnapshot
 from reports.report_generator import ReportGenerator
 
 
@@ -72,22 +73,31 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
     logger.info(f"\n===== [TASK START] {repo_url} =====")
 
     repo_paths = {}
+    snapshots = {}
+    timings = {}   # {phase: seconds}
 
     try:
         # --------------------------------------------------
         # 1️⃣ Clone INPUT repo
         # --------------------------------------------------
-        input_dir = clone_repo(repo_url, depth)
+        with timed(timings, "clone_input"):
+            input_dir = clone_repo(repo_url, depth)
         if not input_dir:
             return {"error": "Failed to clone input repository"}
 
         repo_paths[repo_url] = input_dir
 
+        # read once, shared by ingest and every agent
+        snapshots[repo_url] = RepoSnapshot(input_dir)
+
         # --------------------------------------------------
         # 2️⃣ INGEST input repo into DB
         # --------------------------------------------------
+        # the only fingerprint phase of the task, the orchestrator
+        # reuses input_fp and the ranking below
         fingerprint_agent = FingerprintAgent()
-        input_fp = fingerprint_agent.ingest_repo(repo_url, input_dir)
+        with timed(timings, "ingest"):
+            input_fp = fingerprint_agent.ingest_repo(repo_url, snapshots[repo_url])
 
         logger.info(
             f"[INGEST] repo={repo_url} "
@@ -95,9 +105,10 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
         )
 
         # --------------------------------------------------
-        # 3️⃣ Fetch DB candidates
+        # 3️⃣ Fetch DB candidates (LSH nearest neighbours)
         # --------------------------------------------------
-        db_candidates = get_simhash_candidates(limit=50)
+        with timed(timings, "retrieve"):
+            db_candidates = fingerprint_agent.find_candidates(input_fp, limit=50)
 
         db_candidates = [
             c for c in db_candidates if c["repo_url"] != repo_url
@@ -109,34 +120,20 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
         # --------------------------------------------------
         # 3️⃣.1 Rank DB candidates using fingerprint (TOP-K)
         # --------------------------------------------------
-        ranked = []
-
-        for cand in db_candidates:
-            try:
-                fp_score = fingerprint_agent.compare_with_db(input_fp, cand)
-                ranked.append({
-                    "repo_url": cand["repo_url"],
-                    "score": (
-                        fp_score.get("simhash_score", 0.0)
-                        + fp_score.get("winnowing_score", 0.0)
-                    ),
-                })
-            except Exception:
-                logger.exception(f"[FP COMPARE FAILED] {cand.get('repo_url')}")
-                continue
-
-        ranked.sort(key=lambda x: x["score"], reverse=True)
-        top_k_repos = [r["repo_url"] for r in ranked[:3]]  # TOP-K = 3
+        with timed(timings, "rank"):
+            ranked = fingerprint_agent.compare_many(input_fp, db_candidates, top_k=3)
+        top_k_repos = [r["details"]["candidate_repo"] for r in ranked]  # TOP-K = 3
 
         logger.info(f"[TOP-K] Selected repos: {top_k_repos}")
 
         # --------------------------------------------------
         # 3️⃣.2 Clone ONLY TOP-K candidate repos
         # --------------------------------------------------
-        for cand_url in top_k_repos:
-            cand_dir = clone_repo(cand_url, depth=1)
-            if cand_dir:
-                repo_paths[cand_url] = cand_dir
+        with timed(timings, "clone_candidates"):
+            for cand_url in top_k_repos:
+                cand_dir = clone_repo(cand_url, depth=1)
+                if cand_dir:
+                    repo_paths[cand_url] = cand_dir
 
         # --------------------------------------------------
         # 4️⃣ Run orchestrator (FORCED heavy agents)
@@ -147,29 +144,35 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
             input_repo_url=repo_url,
             input_path=input_dir,
             repo_paths=repo_paths,
-            db_candidates=db_candidates,
             top_k=3,
             force_heavy=False,   
+            snapshots=snapshots,
+            input_fp=input_fp,
+            ranked=ranked,
+            timings=timings,
         )
 
         # --------------------------------------------------
         # 5️⃣ Generate report + PDF
         # --------------------------------------------------
-        reporter = ReportGenerator()
+        with timed(timings, "report"):
+            reporter = ReportGenerator()
 
-        report_name = repo_url.split("/")[-1]
+            report_name = repo_url.split("/")[-1]
 
-        report_path = reporter.generate_html(
-            data={
-                "input_repo": repo_url,
-                "top_3_repos": result["top_3_repos"],
-                "all_repo_scores": result["all_repo_scores"],
-            },
-            report_name=report_name,
-        )
+            report_path = reporter.generate_html(
+                data={
+                    "input_repo": repo_url,
+                    "top_3_repos": result["top_3_repos"],
+                    "all_repo_scores": result["all_repo_scores"],
+                },
+                report_name=report_name,
+            )
 
-        pdf_path = reporter.generate_pdf(report_path)
+            pdf_path = reporter.generate_pdf(report_path)
 
+        timings = {k: round(v, 4) for k, v in timings.items()}
+        logger.info(f"[TIMINGS] {timings}")
         logger.info(f"===== [TASK DONE] {repo_url} =====")
 
         return {
@@ -178,6 +181,7 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
             "all_repo_scores": result["all_repo_scores"],
             "report_path": report_path,
             "pdf_path": pdf_path,
+            "timings": timings,
             "status": "completed",
         }
 
@@ -185,6 +189,9 @@ def analyze_repository_task(self, repo_url: str, depth: int = 1):
         # --------------------------------------------------
         # 6️⃣ Cleanup temp repos
         # --------------------------------------------------
+        for snapshot in snapshots.values():
+            snapshot.close()
+
         time.sleep(0.3)
         for path in repo_paths.values():
             force_delete_folder(path)